@@ -4,12 +4,13 @@
 {
     "name": "FTP Spidy",
     "summary": "FTP Spidy",
-    "version": "13.0.1.0.0",
+    "version": "13.0.1.3.0",
     "author": "Romain Deheele",
     "category": "Warehouse",
     "license": "AGPL-3",
-    "depends": ["stock", "sale", "delivery", "purchase_stock"],
+    "depends": ["stock", "sale", "delivery", "purchase_stock", "queue_job"],
     "data": ['views/spidy_views.xml',
+             'data/queue_job_channel_data.xml',
              'data/spidy_cron.xml',
              'security/ir.model.access.csv'
     ],
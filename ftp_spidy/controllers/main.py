@@ -0,0 +1,28 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from werkzeug.exceptions import Forbidden, NotFound
+
+from odoo import http
+from odoo.http import request
+from odoo.tools import consteq
+
+
+class SpidyMetrics(http.Controller):
+
+    @http.route('/ftp_spidy/metrics', type='http', auth='public', methods=['GET'], csrf=False)
+    def metrics(self, token=None, **kwargs):
+        """Prometheus endpoint, enabled by the ftp_spidy.metrics_token parameter.
+
+        The token is given as ``?token=`` or as a bearer token.
+        """
+        expected = request.env['ir.config_parameter'].sudo().get_param('ftp_spidy.metrics_token')
+        if not expected:
+            raise NotFound()
+        authorization = request.httprequest.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            token = authorization[len('Bearer '):]
+        if not token or not consteq(token, expected):
+            raise Forbidden()
+        body = request.env['ftp.job.metric'].sudo()._prometheus_metrics()
+        return request.make_response(body, headers=[('Content-Type', 'text/plain; version=0.0.4')])
@@ -0,0 +1,18 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+
+def migrate(cr, version):
+    # StockPicking._compute_state used to create a SHIP_OUT event on every
+    # recompute: keep the oldest pending event of each picking so that the
+    # unique index on open events can be created
+    cr.execute("""
+        DELETE FROM ftp_event event
+        USING ftp_event other
+        WHERE event.picking_id = other.picking_id
+          AND event.ftp_type = other.ftp_type
+          AND event.ftp_type IN ('SHIP_OUT', 'REC_OUT')
+          AND event.state = 'draft'
+          AND other.state = 'draft'
+          AND event.id > other.id
+    """)
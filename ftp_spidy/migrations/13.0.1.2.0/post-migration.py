@@ -0,0 +1,15 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+
+def migrate(cr, version):
+    # the name of SHIP_IN jobs used to be read from their attachment
+    cr.execute("""
+        UPDATE ftp_job job
+        SET name = attachment.name
+        FROM ir_attachment attachment
+        WHERE attachment.res_model = 'ftp.job'
+          AND attachment.res_id = job.id
+          AND job.ftp_type = 'SHIP_IN'
+          AND job.name IS NULL
+    """)
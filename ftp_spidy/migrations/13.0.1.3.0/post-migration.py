@@ -0,0 +1,16 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+
+def migrate(cr, version):
+    # the product and barcode crons used to create jobs without products,
+    # left in progress forever: close them
+    cr.execute("""
+        UPDATE ftp_job job
+        SET state = 'done'
+        WHERE job.ftp_type IN ('PRODUCT_OUT', 'BARCODE_OUT')
+          AND job.state = 'progress'
+          AND NOT EXISTS (
+              SELECT 1 FROM ftp_job_product_product_rel rel WHERE rel.ftp_job_id = job.id
+          )
+    """)
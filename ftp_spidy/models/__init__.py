@@ -1 +1,4 @@
 from . import spidy
+from . import ftp_remote_file
+from . import product
+from . import ftp_job_metric
@@ -0,0 +1,75 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from odoo import fields, models, api
+
+PHASES = [('plan', 'Event Collection'),
+          ('parse', 'File Parsing'),
+          ('generate', 'Row Generation'),
+          ('encode', 'Encoding'),
+          ('connect', 'SFTP Connection'),
+          ('transfer', 'SFTP Transfer'),
+          ('validate', 'Picking Validation')]
+
+
+class FtpJobMetric(models.Model):
+    _name = 'ftp.job.metric'
+    _description = 'FTP Job Metric'
+    _order = 'id desc'
+
+    job_id = fields.Many2one('ftp.job', 'Job', required=True, index=True, ondelete='cascade')
+    ftp_type = fields.Selection(related='job_id.ftp_type', store=True)
+    phase = fields.Selection(PHASES, 'Phase', required=True)
+    duration = fields.Float('Duration (s)', digits=(16, 3), group_operator='avg')
+    queries = fields.Integer('Queries')
+    rows = fields.Integer('Rows')
+    bytes = fields.Integer('Bytes')
+    batch_size = fields.Integer('Batch Size', default=1,
+                                help="Number of jobs processed together, whose time and queries are shared.")
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ftp_job_metric_type_phase_index ON ftp_job_metric (ftp_type, phase)
+        """)
+
+    @api.model
+    def _prometheus_metrics(self):
+        """Return the totals of the metrics in the Prometheus text format."""
+        self.flush()
+        self.env.cr.execute("""
+            SELECT ftp_type, phase, count(*), sum(duration), sum(queries), sum(rows), sum(bytes)
+            FROM ftp_job_metric GROUP BY ftp_type, phase ORDER BY ftp_type, phase
+        """)
+        phases = self.env.cr.fetchall()
+        self.env.cr.execute("""
+            SELECT ftp_type, state, count(*) FROM ftp_job GROUP BY ftp_type, state ORDER BY ftp_type, state
+        """)
+        jobs = self.env.cr.fetchall()
+        self.env.cr.execute("""
+            SELECT ftp_type, state, count(*) FROM ftp_event GROUP BY ftp_type, state ORDER BY ftp_type, state
+        """)
+        events = self.env.cr.fetchall()
+
+        lines = []
+
+        def add(name, kind, help, samples):
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in samples:
+                labels = ','.join('%s="%s"' % (key, val or '') for key, val in labels)
+                lines.append('%s{%s} %s' % (name, labels, value))
+
+        def by_phase(index):
+            return [((('type', row[0]), ('phase', row[1])), row[index] or 0) for row in phases]
+
+        def by_state(rows):
+            return [((('type', row[0]), ('state', row[1])), row[2]) for row in rows]
+
+        add('spidy_phase_duration_seconds_count', 'counter', 'Number of measured job phases.', by_phase(2))
+        add('spidy_phase_duration_seconds_sum', 'counter', 'Time spent in the job phases.', by_phase(3))
+        add('spidy_phase_queries_total', 'counter', 'SQL queries run by the job phases.', by_phase(4))
+        add('spidy_phase_rows_total', 'counter', 'File rows written or parsed by the job phases.', by_phase(5))
+        add('spidy_phase_bytes_total', 'counter', 'File bytes encoded or transferred by the job phases.', by_phase(6))
+        add('spidy_jobs', 'gauge', 'Spidy jobs by type and state.', by_state(jobs))
+        add('spidy_events', 'gauge', 'Spidy events by type and state.', by_state(events))
+        return '\n'.join(lines) + '\n'
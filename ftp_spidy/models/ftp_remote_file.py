@@ -0,0 +1,63 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import stat
+
+from odoo import fields, models, api
+
+
+class FtpRemoteFile(models.Model):
+    _name = 'ftp.remote.file'
+    _description = 'FTP Remote File'
+    _order = 'id desc'
+
+    backend_id = fields.Many2one('ftp.backend', 'Backend', required=True, ondelete='cascade')
+    path = fields.Char('Directory', required=True)
+    name = fields.Char('Name', required=True)
+    size = fields.Integer('Size')
+    mtime = fields.Integer('Modification Time')
+    checksum = fields.Char('Checksum')
+    job_id = fields.Many2one('ftp.job', 'Job', ondelete='set null')
+
+    _sql_constraints = [
+        ('remote_file_uniq', 'unique(backend_id, path, name)',
+         'A remote file can only be registered once per backend and directory.'),
+    ]
+
+    @api.model
+    def _get_files_to_fetch(self, backend, path, entries):
+        """Diff a remote listing against the manifest.
+
+        ``entries`` are the ones returned by the ``listdir`` of the backend transport.
+        Returns ``{filename: (entry, manifest record or None)}`` for the files
+        which are new or whose size or modification time changed. Files
+        imported before the manifest existed are registered on the fly from
+        their attachment and are not downloaded again.
+        """
+        entries = {entry.filename: entry for entry in entries
+                   if entry.st_mode is None or stat.S_ISREG(entry.st_mode)}
+        if not entries:
+            return {}
+        known = {remote_file.name: remote_file for remote_file in self.search([
+            ('backend_id', '=', backend.id), ('path', '=', path), ('name', 'in', list(entries))])}
+        unknown = set(entries) - set(known)
+        legacy = {}
+        if unknown:
+            attachments = self.env['ir.attachment'].search_read(
+                [('name', 'in', list(unknown)), ('res_model', '=', 'ftp.job')], ['name', 'res_id'])
+            legacy = {attachment['name']: attachment['res_id'] for attachment in attachments}
+            self.create([{'backend_id': backend.id,
+                          'path': path,
+                          'name': name,
+                          'size': entries[name].st_size,
+                          'mtime': entries[name].st_mtime,
+                          'job_id': job_id} for name, job_id in legacy.items()])
+        to_fetch = {}
+        for name, entry in entries.items():
+            remote_file = known.get(name)
+            if remote_file:
+                if (remote_file.size, remote_file.mtime) != (entry.st_size, entry.st_mtime):
+                    to_fetch[name] = (entry, remote_file)
+            elif name not in legacy:
+                to_fetch[name] = (entry, None)
+        return to_fetch
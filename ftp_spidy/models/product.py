@@ -0,0 +1,37 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from odoo import fields, models, api
+
+# fields sent to Spidy by the PRODUCT_OUT and BARCODE_OUT exports
+SPIDY_PRODUCT_FIELDS = {'default_code', 'name', 'weight', 'list_price', 'barcode'}
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    spidy_change_date = fields.Datetime('Spidy Change Date', index=True, copy=False, readonly=True,
+                                        help="Last change of a field exported to Spidy.")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        now = fields.Datetime.now()
+        for vals in vals_list:
+            vals.setdefault('spidy_change_date', now)
+        return super(ProductProduct, self).create(vals_list)
+
+    def write(self, vals):
+        if SPIDY_PRODUCT_FIELDS.intersection(vals):
+            vals = dict(vals, spidy_change_date=fields.Datetime.now())
+        return super(ProductProduct, self).write(vals)
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def write(self, vals):
+        res = super(ProductTemplate, self).write(vals)
+        if SPIDY_PRODUCT_FIELDS.intersection(vals):
+            self.with_context(active_test=False).mapped('product_variant_ids').write(
+                {'spidy_change_date': fields.Datetime.now()})
+        return res
@@ -0,0 +1,189 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import logging
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import paramiko
+from paramiko.common import DEFAULT_MAX_PACKET_SIZE, DEFAULT_WINDOW_SIZE
+
+_logger = logging.getLogger(__name__)
+
+# errors after which a channel (or its transport) can't be trusted anymore
+NETWORK_ERRORS = (socket.error, EOFError, paramiko.SSHException)
+# seconds allowed to the TCP connection, the SSH banner, the key exchange and the authentication
+CONNECT_TIMEOUT = 30
+
+
+class SFTPSession(object):
+    """Authenticated SSH transport and the idle SFTP channels opened on it."""
+
+    def __init__(self, params, keepalive, idle_timeout):
+        host, port, username, password, window_size, max_packet_size = params
+        self.params = params
+        self.idle_timeout = idle_timeout
+        sock = socket.create_connection((host, port or 22), timeout=CONNECT_TIMEOUT)
+        self.transport = paramiko.Transport(sock,
+                                            default_window_size=window_size or DEFAULT_WINDOW_SIZE,
+                                            default_max_packet_size=max_packet_size or DEFAULT_MAX_PACKET_SIZE)
+        self.transport.banner_timeout = CONNECT_TIMEOUT
+        self.transport.handshake_timeout = CONNECT_TIMEOUT
+        self.transport.auth_timeout = CONNECT_TIMEOUT
+        if keepalive:
+            self.transport.set_keepalive(keepalive)
+        try:
+            self.transport.connect(None, username, password)
+        except Exception:
+            _close_quietly(self.transport)
+            raise
+        self.idle_channels = []
+        self.in_use = 0
+        self.last_used = time.time()
+
+    def is_alive(self):
+        return self.transport.is_active()
+
+    def is_idle(self, now):
+        return not self.in_use and now - self.last_used > self.idle_timeout
+
+    def pop_channel(self):
+        while True:
+            try:
+                sftp = self.idle_channels.pop()
+            except IndexError:
+                return paramiko.SFTPClient.from_transport(self.transport)
+            try:
+                sftp.stat('.')
+                return sftp
+            except NETWORK_ERRORS + (IOError,):
+                _close_quietly(sftp)
+
+    def close(self):
+        for sftp in self.idle_channels:
+            _close_quietly(sftp)
+        self.idle_channels = []
+        _close_quietly(self.transport)
+
+
+class SFTPSessionPool(object):
+    """Process wide pool of SFTP sessions, one transport per backend key.
+
+    Channels are handed out by :meth:`channel`, returned to the pool when
+    the block exits normally and dropped when it raised a network error.
+    Sessions unused for longer than their idle timeout are closed on the
+    next access to the pool.
+
+    The lock only guards the bookkeeping: sessions are opened and closed
+    outside of it, a key being connected is reserved so that the other
+    threads wait for its session instead of opening their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._sessions = {}
+        self._connecting = set()
+
+    @contextmanager
+    def channel(self, key, params, keepalive=30, idle_timeout=300):
+        session, sftp = self._acquire(key, params, keepalive, idle_timeout)
+        broken = False
+        try:
+            yield sftp
+        except NETWORK_ERRORS:
+            broken = True
+            raise
+        finally:
+            self._release(key, session, sftp, broken)
+
+    def close(self, key):
+        with self._lock:
+            session = self._sessions.pop(key, None)
+        if session:
+            session.close()
+
+    def _acquire(self, key, params, keepalive, idle_timeout):
+        to_close = []
+        with self._lock:
+            to_close += self._evict_idle()
+            while True:
+                session = self._sessions.get(key)
+                if session and (session.params != params or not session.is_alive()):
+                    del self._sessions[key]
+                    if not session.in_use:
+                        to_close.append(session)
+                    session = None
+                if session or key not in self._connecting:
+                    break
+                self._lock.wait()
+            if session:
+                session.in_use += 1
+                session.last_used = time.time()
+            else:
+                self._connecting.add(key)
+        _close_all(to_close)
+        if not session:
+            _logger.debug('Opening SFTP session %s', key)
+            try:
+                session = SFTPSession(params, keepalive, idle_timeout)
+            except Exception:
+                with self._lock:
+                    self._connecting.discard(key)
+                    self._lock.notify_all()
+                raise
+            with self._lock:
+                self._connecting.discard(key)
+                self._sessions[key] = session
+                session.in_use += 1
+                self._lock.notify_all()
+        try:
+            return session, session.pop_channel()
+        except Exception:
+            self._release(key, session, None, True)
+            raise
+
+    def _release(self, key, session, sftp, broken):
+        to_close = []
+        with self._lock:
+            session.in_use -= 1
+            session.last_used = time.time()
+            if sftp is not None and not broken and session.is_alive():
+                session.idle_channels.append(sftp)
+                return
+            if sftp is not None:
+                to_close.append(sftp)
+            if not session.is_alive() or self._sessions.get(key) is not session:
+                if self._sessions.get(key) is session:
+                    del self._sessions[key]
+                if not session.in_use:
+                    to_close.append(session)
+        _close_all(to_close)
+
+    def _evict_idle(self):
+        """Remove the idle sessions from the pool and return them, to be closed out of the lock."""
+        now = time.time()
+        evicted = []
+        for key, session in list(self._sessions.items()):
+            if session.is_idle(now):
+                _logger.debug('Closing idle SFTP session %s', key)
+                del self._sessions[key]
+                evicted.append(session)
+        return evicted
+
+
+def _close_all(resources):
+    for resource in resources:
+        _close_quietly(resource)
+
+
+def _close_quietly(resource):
+    try:
+        resource.close()
+    except Exception:
+        _logger.debug('Error while closing %s', resource, exc_info=True)
+
+
+SFTP_POOL = SFTPSessionPool()
+
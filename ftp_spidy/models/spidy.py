@@ -2,13 +2,104 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
 import io, csv
+import os
 import base64
-import ftplib
-import paramiko
+import gzip
+import hashlib
+import shutil
+import tempfile
+import time
 from datetime import datetime
+import logging
+import psycopg2
 import pytz
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing, contextmanager
 from dateutil.relativedelta import relativedelta
-from odoo import fields, models, api
+from odoo import _, api, fields, models
+from odoo.exceptions import ValidationError
+from odoo.tools import split_every
+from odoo.addons.queue_job.exception import RetryableJobError
+from odoo.addons.queue_job.job import identity_exact, job
+from .sftp_pool import SFTP_POOL
+from .transport import FILE_CHUNK_SIZE, NETWORK_ERRORS, FTPDriver, LocalDriver, SFTPDriver
+from .spidy_format import FORMATS
+
+_logger = logging.getLogger(__name__)
+
+# number of ftp.job processed by one queue job when they are batched
+QUEUE_BATCH_SIZE = 100
+# delays (seconds) between the retries of a queue job failing on network errors
+NETWORK_RETRY_PATTERN = {1: 60, 3: 300, 5: 900}
+# ftp.backend field keeping the date of the last product export sent, per type
+EXPORT_WATERMARKS = {'PRODUCT_OUT': 'product_out_date', 'BARCODE_OUT': 'barcode_out_date'}
+# products are searched from this long before the last export date: a
+# change is dated when it is written but only visible once committed
+EXPORT_OVERLAP = relativedelta(minutes=10)
+# ftp.backend field showing the last event claimed by a job, per type
+EVENT_CURSORS = {'SHIP_OUT': 'ship_out_event_cursor', 'REC_OUT': 'rec_out_event_cursor'}
+GZIP_MIMETYPE = 'application/gzip'
+GZIP_SUFFIX = '.gz'
+# number of orders of the SHIP_IN files resolved together
+SHIP_IN_CHUNK_SIZE = 1000
+# number of ftp.job removed by one queue job of the retention policy
+PRUNE_BATCH_SIZE = 500
+
+
+def stream_checksum(stream):
+    """Return the sha1 and the size of a binary stream, rewound afterwards."""
+    sha, size = hashlib.sha1(), 0
+    for chunk in iter(lambda: stream.read(FILE_CHUNK_SIZE), b''):
+        sha.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return sha.hexdigest(), size
+
+
+def gzip_stream(stream):
+    """Compress a binary stream into a temporary file, rewound.
+
+    The gzip header carries no timestamp so that the same content always
+    gives the same compressed file, and the same filestore entry.
+    """
+    tmp = tempfile.TemporaryFile()
+    with gzip.GzipFile(filename='', mode='wb', fileobj=tmp, mtime=0) as compressed:
+        shutil.copyfileobj(stream, compressed, FILE_CHUNK_SIZE)
+    tmp.seek(0)
+    return tmp
+
+
+def _close_transfer_result(future):
+    """Close the stream returned by a transfer nobody will read."""
+    if not future.cancelled() and not future.exception():
+        result = future.result()
+        if hasattr(result, 'close'):
+            result.close()
+
+
+@contextmanager
+def measure(cr):
+    """Yield a dict filled with the time and queries spent in the block."""
+    values = {'rows': 0, 'bytes': 0}
+    start, queries = time.perf_counter(), cr.sql_log_count
+    yield values
+    values['duration'] = time.perf_counter() - start
+    values['queries'] = cr.sql_log_count - queries
+
+
+def timed_rows(rows, cr, values):
+    """Iterate rows, adding to ``values`` the time and queries spent producing them."""
+    rows = iter(rows)
+    while True:
+        start, queries = time.perf_counter(), cr.sql_log_count
+        try:
+            row = next(rows)
+        except StopIteration:
+            return
+        finally:
+            values['duration'] += time.perf_counter() - start
+            values['queries'] += cr.sql_log_count - queries
+        yield row
 
 
 class PurchaseOrder(models.Model):
@@ -16,9 +107,10 @@ class PurchaseOrder(models.Model):
 
     def button_approve(self, force=False):
         result = super(PurchaseOrder, self).button_approve(force=force)
-        if self.picking_ids:
-            self.env['ftp.event'].create({'picking_id': self.picking_ids[0].id,
-                                          'ftp_type': 'REC_OUT'})
+        pickings = self.env['stock.picking']
+        for order in self:
+            pickings |= order.picking_ids[:1]
+        self.env['ftp.event']._create_open_events(pickings, 'REC_OUT')
         return result
 
 
@@ -26,28 +118,148 @@ class FtpBackend(models.Model):
     _name = 'ftp.backend'
 
     name = fields.Char('FTP Backend')
+    protocol = fields.Selection([('sftp', 'SFTP'), ('ftp', 'FTP'), ('local', 'Local Directory')], 'Protocol',
+                                default='sftp', required=True)
     host = fields.Char('URL')
     port = fields.Integer('Port')
     username = fields.Char('Username')
     password = fields.Char('Password')
+    keepalive = fields.Integer('Keepalive (s)', default=30,
+                               help="Interval of the SSH keepalive packets sent on pooled sessions, 0 to disable.")
+    idle_timeout = fields.Integer('Idle Timeout (s)', default=300,
+                                  help="Pooled sessions unused for longer than this are closed.")
+    sftp_window_size = fields.Integer('SSH Window Size',
+                                      help="Bytes sent before waiting for an acknowledgement, 0 for the default.")
+    sftp_max_packet_size = fields.Integer('SSH Max Packet Size', help="0 for the default.")
+    sftp_pipelined = fields.Boolean('Pipelined Transfers', default=True,
+                                    help="Stream uploads without waiting for each write and prefetch downloads.")
+    local_path = fields.Char('Local Directory',
+                             help="With the Local Directory protocol, remote paths are taken under this directory.")
+
+    in_path = fields.Char('Incoming Directory', required=True, default='/RES/IN/RES/CR_PRE/',
+                          help="Directory the SHIP_IN files are fetched from.")
+    out_path = fields.Char('Outgoing Directory', required=True, default='/RES/OUT/',
+                           help="Directory the exported files are sent to.")
+    archive_path = fields.Char('Archive Directory',
+                               help="When set, imported files are moved to this remote directory.")
+    product_out_date = fields.Datetime('Last Product Export', copy=False,
+                                       help="Products changed after this date are sent by the next export.")
+    barcode_out_date = fields.Datetime('Last Barcode Export', copy=False,
+                                       help="Barcodes changed after this date are sent by the next export.")
+    ship_out_event_cursor = fields.Integer('Last SHIP_OUT Event', compute='_compute_event_cursors')
+    rec_out_event_cursor = fields.Integer('Last REC_OUT Event', compute='_compute_event_cursors')
+    transfer_workers = fields.Integer('Parallel Transfers', default=4,
+                                      help="Number of files uploaded or downloaded at the same time.")
+    compress_files = fields.Boolean('Compress Files',
+                                    help="Store the files of the jobs gzipped. They are sent uncompressed.")
+    retention_days = fields.Integer('Retention (days)',
+                                    help="Done jobs older than this are pruned every day, 0 to keep them forever.")
+    retention_policy = fields.Selection([('files', 'Remove Files'), ('jobs', 'Remove Jobs')], 'Retention Policy',
+                                        default='files',
+                                        help="Remove only the files of the old jobs, or the jobs with their events.")
+
+    def _compute_event_cursors(self):
+        groups = self.env['ftp.job'].read_group([('backend_id', 'in', self.ids), ('ftp_type', 'in', list(EVENT_CURSORS))],
+                                                ['backend_id', 'ftp_type', 'event_cursor:max'],
+                                                ['backend_id', 'ftp_type'], lazy=False)
+        cursors = {(group['backend_id'][0], group['ftp_type']): group['event_cursor'] for group in groups}
+        for backend in self:
+            for ftp_type, field_name in EVENT_CURSORS.items():
+                backend[field_name] = cursors.get((backend.id, ftp_type)) or 0
+
+    @api.constrains('protocol', 'local_path')
+    def _check_local_path(self):
+        for backend in self:
+            if backend.protocol == 'local' and not backend.local_path:
+                raise ValidationError(_('The FTP backend %s needs a local directory.') % backend.name)
+
+    def _sftp_pool_key(self):
+        return (self.env.cr.dbname, self.id)
+
+    def _sftp_pool_args(self):
+        self.ensure_one()
+        return (self._sftp_pool_key(),
+                (self.host, self.port, self.username, self.password,
+                 self.sftp_window_size, self.sftp_max_packet_size),
+                self.keepalive, self.idle_timeout)
+
+    def _get_transport(self):
+        """Return the driver of the backend protocol.
+
+        Drivers hold no record, so that they can be used from the transfer
+        threads.
+        """
+        self.ensure_one()
+        if self.protocol == 'ftp':
+            return FTPDriver(self.host, self.port, self.username, self.password)
+        if self.protocol == 'local':
+            return LocalDriver(self.local_path)
+        return SFTPDriver(self._sftp_pool_args(), self.sftp_pipelined)
+
+    def _run_transfers(self, func, items):
+        """Run ``func(*item)`` for each item in a bounded thread pool.
+
+        Yields ``(item, result, error)`` in completion order so that the caller
+        can already process a file while the next ones are transferred. Workers
+        only do network I/O: all database access stays in the calling thread.
+
+        When the caller stops early, the transfers not started yet are
+        cancelled and the results it did not get are closed.
+        """
+        executor = ThreadPoolExecutor(max_workers=max(self.transfer_workers, 1))
+        futures = {executor.submit(func, *item): item for item in items}
+        pending = set(futures)
+        try:
+            for future in as_completed(futures):
+                pending.discard(future)
+                error = future.exception()
+                yield futures[future], None if error else future.result(), error
+        finally:
+            for future in pending:
+                if not future.cancel():
+                    # already running or done: closed once there
+                    future.add_done_callback(_close_transfer_result)
+            executor.shutdown(wait=False)
+
+    def _download_files(self, transport, remote_paths):
+        """Download the files, yields ``(remote_path, stream)``.
+
+        Raises the first error, the other downloads being cancelled.
+        """
+        transfers = self._run_transfers(transport.download, [(path,) for path in remote_paths])
+        with closing(transfers):
+            for (remote_path,), stream, error in transfers:
+                if error:
+                    raise error
+                yield remote_path, stream
+
+    def _upload_files(self, transport, transfers):
+        """Upload ``(local_path, remote_path, compressed)``, yields (transfer, error)."""
+        for transfer, dummy, error in self._run_transfers(transport.upload, transfers):
+            yield transfer, error
+
+    def unlink(self):
+        for backend in self.filtered(lambda backend: backend.protocol == 'sftp'):
+            SFTP_POOL.close(backend._sftp_pool_key())
+        return super(FtpBackend, self).unlink()
 
 
 class FtpEvent(models.Model):
     _name = "ftp.event"
     _order = "id desc"
 
-    def _compute_name(self):
+    @api.depends('ftp_type')
+    def _compute_direction(self):
         for event in self:
-            if event.picking_id:
-                event.name = event.picking_id.name
-            else:
-                event.name = ''
+            event.direction = 'out' if event.ftp_type and event.ftp_type.endswith('_OUT') else 'in'
 
-    name = fields.Char('Name', compute='_compute_name')
+    name = fields.Char('Name', related='picking_id.name', store=True)
     ftp_type = fields.Selection([('SHIP_OUT', 'SHIP_OUT'), ('REC_OUT', 'REC_OUT'), ('SHIP_IN', 'SHIP_IN')], 'Type', default='SHIP_OUT')
+    direction = fields.Selection([('in', 'In'), ('out', 'Out')], 'Direction',
+                                 compute='_compute_direction', store=True)
     state = fields.Selection([('draft', 'Draft'), ('ready', 'Ready'), ('done', 'Done')], 'State', default='draft')
-    job_id = fields.Many2one('ftp.job', 'Job')
-    picking_id = fields.Many2one('stock.picking', 'Picking')
+    job_id = fields.Many2one('ftp.job', 'Job', index=True)
+    picking_id = fields.Many2one('stock.picking', 'Picking', index=True)
     sale_id = fields.Many2one('sale.order', related='picking_id.sale_id', string='Sale Order')
     partner_id = fields.Many2one('res.partner', related='picking_id.partner_id', string='Partner')
     tracking_number = fields.Char('Tracking Number')
@@ -61,18 +273,105 @@ class FtpEvent(models.Model):
                 return {'domain': {'picking_id': [('picking_type_id', '=', 1),('state','=','assigned')]}}
 
     def action_done(self):
-        if self.ftp_type == 'SHIP_IN':
-            if not self.picking_id.carrier_tracking_ref:
-                if self.tracking_number:
-                    self.picking_id.write({'carrier_tracking_ref': self.tracking_number})
-            if self.picking_id.state not in ['done','cancel']:
-                self.picking_id.validate_picking()
-        self.write({'state': 'done'})
+        ship_in_events = self.filtered(lambda event: event.ftp_type == 'SHIP_IN')
+        done_events = (self - ship_in_events) | ship_in_events._validate_pickings()
+        done_events.write({'state': 'done'})
+        return True
+
+    def _validate_pickings(self):
+        """Set the tracking numbers and validate the pickings of the events.
+
+        Tracking numbers are written with one write per value and the
+        pickings validated as a single recordset. When that fails, every
+        picking is validated again in its own savepoint so that one bad
+        picking does not block the others. Returns the events whose
+        picking was validated.
+        """
+        tracking_by_picking = {}
+        for event in self:
+            if event.tracking_number and not event.picking_id.carrier_tracking_ref:
+                tracking_by_picking.setdefault(event.picking_id, event.tracking_number)
+        pickings_by_tracking = {}
+        for picking, tracking in tracking_by_picking.items():
+            pickings_by_tracking.setdefault(tracking, self.env['stock.picking'])
+            pickings_by_tracking[tracking] |= picking
+        for tracking, pickings in pickings_by_tracking.items():
+            pickings.write({'carrier_tracking_ref': tracking})
+        pickings = self.mapped('picking_id').filtered(lambda picking: picking.state not in ['done', 'cancel'])
+        if not pickings:
+            return self
+        failed = self.env['stock.picking']
+        self.flush()
+        try:
+            with self.env.cr.savepoint():
+                pickings.validate_picking()
+                pickings.flush()
+        except Exception:
+            # also drops the pending writes and computations of the rolled back validation
+            self.env.clear()
+            _logger.warning('Batch validation of %d pickings failed, validating them one by one', len(pickings))
+            for picking in pickings:
+                try:
+                    with self.env.cr.savepoint():
+                        picking.validate_picking()
+                        picking.flush()
+                except Exception:
+                    self.env.clear()
+                    _logger.exception('Validation of picking %s failed', picking.name)
+                    failed |= picking
+        return self.filtered(lambda event: event.picking_id not in failed)
+
+    def init(self):
+        # one pending export event per picking and type
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ftp_event_open_picking_uniq
+            ON ftp_event (picking_id, ftp_type)
+            WHERE state = 'draft' AND ftp_type IN ('SHIP_OUT', 'REC_OUT')
+        """)
+        # events waiting for a job, claimed by type in id order
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ftp_event_unassigned_index
+            ON ftp_event (ftp_type, id) WHERE job_id IS NULL
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ftp_event_type_state_index ON ftp_event (ftp_type, state)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ftp_event_direction_state_index ON ftp_event (direction, state)
+        """)
+
+    @api.model
+    def _create_open_events(self, pickings, ftp_type):
+        """Create the export events of the pickings which have none pending.
+
+        Pickings already having a draft or ready event of this type are
+        skipped, and the remaining events are created with one create.
+        """
+        if not pickings:
+            return self.browse()
+        existing = self.search([('picking_id', 'in', pickings.ids), ('ftp_type', '=', ftp_type),
+                                ('state', '!=', 'done')])
+        vals_list = [{'picking_id': picking.id, 'ftp_type': ftp_type}
+                     for picking in pickings - existing.mapped('picking_id')]
+        if not vals_list:
+            return self.browse()
+        try:
+            with self.env.cr.savepoint():
+                return self.create(vals_list)
+        except psycopg2.IntegrityError:
+            # a concurrent transaction created some of them meanwhile
+            events = self.browse()
+            for vals in vals_list:
+                try:
+                    with self.env.cr.savepoint():
+                        events |= self.create(vals)
+                except psycopg2.IntegrityError:
+                    pass
+            return events
 
     def execute_ready_in_events(self):
-        ready_in_events = self.search([('ftp_type','like','%IN'), ('state','=','ready')])
-        for event in ready_in_events:
-            event.action_done()
+        ready_in_events = self.search([('direction', '=', 'in'), ('state', '=', 'ready')])
+        ready_in_events.action_done()
         return True
 
 
@@ -81,17 +380,28 @@ class FtpJob(models.Model):
     _inherit = ['portal.mixin', 'mail.thread', 'mail.activity.mixin']
     _order = "id desc"
 
+    @api.depends('ftp_type', 'to_datetime')
     def _compute_name(self):
+        tz = pytz.timezone('Europe/Paris')
         for job in self:
             if job.ftp_type == 'SHIP_IN':
-                attachment = self.env['ir.attachment'].search([('res_model','=','ftp.job'),('res_id','=',job.id)])
-                job.name = attachment.name
-            else:
-                tz = pytz.timezone('Europe/Paris')
+                # set from the name of the file when it is imported
+                job.name = job.name
+            elif job.ftp_type and job.to_datetime:
                 to_datetime = pytz.utc.localize(job.to_datetime).astimezone(tz)
                 job.name = job.ftp_type + ' ' + to_datetime.strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                job.name = False
 
-    name = fields.Char('Name', compute='_compute_name')
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ftp_job_type_state_index ON ftp_job (ftp_type, state)
+        """)
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS ftp_job_type_id_index ON ftp_job (ftp_type, id)
+        """)
+
+    name = fields.Char('Name', compute='_compute_name', store=True, readonly=False)
     ftp_type = fields.Selection([('BARCODE_OUT', 'Barcode OUT'),
                                  ('PRODUCT_OUT', 'Product OUT'),
                                  ('PRODUCT_IN', 'Product IN'),
@@ -109,36 +419,176 @@ class FtpJob(models.Model):
                               ('done', 'Done')], 'State', default='draft')
     event_ids = fields.One2many('ftp.event', 'job_id', 'Events')
     product_ids = fields.Many2many('product.product', string='Products')
+    backend_id = fields.Many2one('ftp.backend', 'Backend',
+                                 default=lambda self: self.env['ftp.backend'].search([], limit=1))
+    file_checksum = fields.Char('File Checksum', copy=False, readonly=True,
+                                help="SHA1 of the uncompressed file of the job.")
+    file_rows = fields.Integer('File Rows', copy=False, readonly=True)
+    file_size = fields.Integer('File Size', copy=False, readonly=True)
+    metric_ids = fields.One2many('ftp.job.metric', 'job_id', 'Metrics', readonly=True)
+    event_cursor = fields.Integer('Event Cursor', copy=False, readonly=True,
+                                  help="Highest id of the events claimed by the job.")
+
+    @contextmanager
+    def _measure(self, phase):
+        """Record the time and queries of a phase of the jobs.
+
+        The block may set the ``rows`` and ``bytes`` it handled in the
+        yielded dict. Nothing is recorded when it raises.
+        """
+        with measure(self.env.cr) as values:
+            yield values
+        self._record_metrics(phase, values)
+
+    def _record_metrics(self, phase, values):
+        """Store the measure of a phase, shared evenly by the jobs of the batch."""
+        if not self:
+            return
+        size = len(self)
+        self.env['ftp.job.metric'].create([{
+            'job_id': job.id,
+            'phase': phase,
+            'batch_size': size,
+            'duration': values.get('duration', 0.0) / size,
+            'queries': values.get('queries', 0) // size,
+            'rows': values.get('rows', 0) // size,
+            'bytes': values.get('bytes', 0) // size,
+        } for job in self])
+
+    def _split_batches(self, size=QUEUE_BATCH_SIZE):
+        for index in range(0, len(self), size):
+            yield self[index:index + size]
+
+    def _delay(self, channel):
+        return self.with_delay(channel=channel, identity_key=identity_exact)
+
+    # a queue job may run after its ftp.job was processed by another one:
+    # only the jobs still in the expected state are processed
+
+    @job(default_channel='root.spidy.out')
+    def _job_plan(self):
+        self.filtered(lambda job: job.state == 'draft').action_plan()
+
+    @job(default_channel='root.spidy.out')
+    def _job_make_file(self):
+        for job in self.filtered(lambda job: job.state == 'progress'):
+            job.action_make_file()
+
+    @job(default_channel='root.spidy.out', retry_pattern=NETWORK_RETRY_PATTERN)
+    def _job_done(self):
+        jobs = self.filtered(lambda job: job.state == 'ready')
+        if not jobs:
+            return
+        try:
+            jobs.action_done()
+        except NETWORK_ERRORS as err:
+            raise RetryableJobError(str(err))
+
+    @job(default_channel='root.spidy.in', retry_pattern=NETWORK_RETRY_PATTERN)
+    def _job_receive_files(self, remote_path, ftp_type):
+        try:
+            self.action_receive_files(remote_path, ftp_type)
+        except NETWORK_ERRORS as err:
+            raise RetryableJobError(str(err))
+
+    @job(default_channel='root.spidy.in', retry_pattern=NETWORK_RETRY_PATTERN)
+    def _job_archive_files(self, remote_dir, filenames):
+        try:
+            self.action_archive_files(remote_dir, filenames)
+        except NETWORK_ERRORS as err:
+            raise RetryableJobError(str(err))
+
+    @job(default_channel='root.spidy')
+    def _job_prune(self, policy):
+        self._prune(policy)
 
     def _scheduler_ftp_in_action_ready(self):
-        draft_jobs = self.search([('ftp_type', '=', 'SHIP_IN'), ('state', '=', 'draft')])
-        for job in draft_jobs:
-            job.action_plan()
+        draft_jobs = self.search([('ftp_type', '=', 'SHIP_IN'), ('state', '=', 'draft')], order='id')
+        for jobs in draft_jobs._split_batches():
+            jobs._delay('root.spidy.in')._job_plan()
         return True
 
     def _scheduler_ftp_in_action_done(self):
-        ready_jobs = self.search([('ftp_type', '=', 'SHIP_IN'), ('state', '=', 'ready')])
-        for job in ready_jobs:
-            job.action_done()
+        ready_jobs = self.search([('ftp_type', '=', 'SHIP_IN'), ('state', '=', 'ready')], order='id')
+        for jobs in ready_jobs._split_batches():
+            jobs._delay('root.spidy.in')._job_done()
         return True
 
     def _scheduler_ftp_out_action_done(self):
-        ready_jobs = self.search([('ftp_type', '=', 'SHIP_OUT'), ('state', '=', 'ready')])
+        ready_jobs = self.search([('ftp_type', 'in', list(EVENT_CURSORS) + list(EXPORT_WATERMARKS)),
+                                  ('state', '=', 'ready')], order='id')
+        jobs_by_backend = {}
         for job in ready_jobs:
-            job.action_done()
+            jobs_by_backend.setdefault(job.backend_id, self.browse())
+            jobs_by_backend[job.backend_id] |= job
+        # the files of a batch are uploaded in parallel
+        for backend_jobs in jobs_by_backend.values():
+            for jobs in backend_jobs._split_batches():
+                jobs._delay('root.spidy.out')._job_done()
         return True
 
     def _scheduler_ftp_import_in_files(self):
-        self.action_receive_files('/IN/RES/CR_PRE/', 'SHIP_IN')
+        self._delay('root.spidy.in')._job_receive_files(False, 'SHIP_IN')
         #self.action_receive_files('/IN/RES/CR_REC/', 'REC_IN')
         #self.action_receive_files('/IN/RES/CR_MVT/', 'MVT_IN')
         return True
 
     def _scheduler_ftp_export_products(self):
-        self.create({'ftp_type': 'PRODUCT_OUT', 'state': 'progress'})
+        self._create_product_export_job('PRODUCT_OUT')
 
     def _scheduler_ftp_export_barcodes(self):
-        self.create({'ftp_type': 'BARCODE_OUT', 'state': 'progress'})
+        self._create_product_export_job('BARCODE_OUT')
+
+    def _create_product_export_job(self, ftp_type):
+        """Create an export of the products changed since the last one sent.
+
+        Nothing is created while a previous export of the same type is still
+        pending, nor when no product changed. The products changed shortly
+        before the last export are sent again, in case their change was not
+        committed yet when it ran.
+        """
+        if self.search_count([('ftp_type', '=', ftp_type), ('state', 'in', ['progress', 'ready']),
+                              ('product_ids', '!=', False)]):
+            return self.browse()
+        backend = self._get_backend()
+        now = fields.Datetime.now()
+        last_date = backend[EXPORT_WATERMARKS[ftp_type]]
+        from_date = last_date and last_date - EXPORT_OVERLAP
+        domain = [('spidy_change_date', '>', from_date), ('spidy_change_date', '<=', now)] if from_date else []
+        products = self.env['product.product'].search(domain)
+        if not products:
+            return self.browse()
+        new_job = self.create({'ftp_type': ftp_type,
+                               'backend_id': backend.id,
+                               'from_datetime': from_date,
+                               'to_datetime': now,
+                               'product_ids': [(6, 0, products.ids)],
+                               'state': 'progress'})
+        new_job._delay('root.spidy.out')._job_make_file()
+        return new_job
+
+    def _scheduler_ftp_prune_jobs(self):
+        """Apply the retention policy of the backends to their done jobs."""
+        default_backend = self.env['ftp.backend'].search([], limit=1)
+        for backend in self.env['ftp.backend'].search([('retention_days', '>', 0)]):
+            limit_date = fields.Datetime.now() - relativedelta(days=backend.retention_days)
+            # jobs created before the backend field belong to the default backend
+            backend_ids = [backend.id, False] if backend == default_backend else [backend.id]
+            old_jobs = self.search([('backend_id', 'in', backend_ids), ('state', '=', 'done'),
+                                    ('to_datetime', '<', limit_date)], order='id')
+            if backend.retention_policy == 'files':
+                attachments = self.env['ir.attachment'].search_read([('res_model', '=', 'ftp.job'),
+                                                                     ('res_id', 'in', old_jobs.ids)], ['res_id'])
+                old_jobs = self.browse(sorted({attachment['res_id'] for attachment in attachments}))
+            for jobs in old_jobs._split_batches(PRUNE_BATCH_SIZE):
+                jobs._delay('root.spidy')._job_prune(backend.retention_policy)
+        return True
+
+    def _prune(self, policy):
+        self.env['ir.attachment'].search([('res_model', '=', 'ftp.job'), ('res_id', 'in', self.ids)]).unlink()
+        if policy == 'jobs':
+            self.mapped('event_ids').unlink()
+            self.unlink()
 
     def _set_datetime_job(self, ftp_type, from_datetime):
         now = fields.Datetime.now()
@@ -150,172 +600,233 @@ class FtpJob(models.Model):
         return new_job
 
     def _scheduler_ftp_export_shipping(self):
-        last_job = self.search([('ftp_type','=','SHIP_OUT')], order='id desc', limit=1)
-        from_datetime = last_job and last_job.to_datetime or False
-        new_job = self._set_datetime_job('SHIP_OUT', last_job.to_datetime)
-        new_job.action_plan()
+        self._create_event_export_job('SHIP_OUT')
+
+    def _scheduler_ftp_export_receiving(self):
+        self._create_event_export_job('REC_OUT')
+
+    def _create_event_export_job(self, ftp_type):
+        """Create and plan an export job when events of the type wait for one."""
+        if not self.env['ftp.event'].search([('ftp_type', '=', ftp_type), ('job_id', '=', False)], limit=1):
+            return self.browse()
+        last_job = self.search([('ftp_type', '=', ftp_type)], order='id desc', limit=1)
+        new_job = self._set_datetime_job(ftp_type, last_job.to_datetime)
+        new_job._delay('root.spidy.out')._job_plan()
+        return new_job
+
+    def _iter_ship_in_orders(self):
+        """Yield ``(job, order name, tracking)`` for the orders of the job files.
+
+        A file may acknowledge several orders: each ENT row opens an order
+        and the COL rows which follow it carry its tracking number. Files are
+        decoded while they are read, one order at a time.
+        """
+        attachments = self.env['ir.attachment'].search([('res_model', '=', 'ftp.job'), ('res_id', 'in', self.ids)])
+        parsed_job_ids = set()
+        for attachment in attachments:
+            if attachment.res_id in parsed_job_ids:
+                continue
+            parsed_job_ids.add(attachment.res_id)
+            job = self.browse(attachment.res_id)
+            with self._open_attachment(attachment) as stream:
+                reader = csv.reader(io.TextIOWrapper(stream, encoding='iso-8859-1', newline=''), delimiter=';')
+                for order, records in FORMATS['SHIP_IN'].groups(reader):
+                    tracking = ''
+                    for record_type, values in records:
+                        if record_type == 'COL':
+                            tracking = values['tracking']
+                    yield job, order['order_name'], tracking
+
+    def _create_ship_in_events(self):
+        """Create the SHIP_IN events of all the jobs.
 
-    def _scheduler_ftp_export_receiving(self, interval_numer):
-        last_job = self.search([('ftp_type','=','REC_OUT')], order='id desc', limit=1)
-        from_datetime = last_job and last_job.to_datetime or False
-        self._set_datetime_job('REC_OUT')
+        Orders are read by chunks, whose orders and outgoing pickings are
+        resolved with one search each. Returns the jobs for which an order
+        was found.
+        """
+        found_jobs = self.browse()
+        with self._measure('parse') as metric:
+            for chunk in split_every(SHIP_IN_CHUNK_SIZE, self._iter_ship_in_orders()):
+                metric['rows'] += len(chunk)
+                found_jobs |= self._create_ship_in_chunk_events(chunk)
+        return found_jobs
+
+    def _create_ship_in_chunk_events(self, chunk):
+        orders_by_job = {}
+        for job, sale_name, tracking in chunk:
+            orders = orders_by_job.setdefault(job, {})
+            if tracking or sale_name not in orders:
+                orders[sale_name] = tracking
+        names = {name for orders in orders_by_job.values() for name in orders}
+        sale_ids_by_name = {}
+        for sale in self.env['sale.order'].search_read([('name', 'in', list(names))], ['name']):
+            sale_ids_by_name.setdefault(sale['name'], []).append(sale['id'])
+        picking_ids_by_sale = {}
+        sale_ids = [sale_id for sale_ids in sale_ids_by_name.values() for sale_id in sale_ids]
+        for pick in self.env['stock.picking'].search_read([('sale_id', 'in', sale_ids), ('picking_type_id', '=', 2)],
+                                                          ['sale_id'], load=None):
+            picking_ids_by_sale.setdefault(pick['sale_id'], []).append(pick['id'])
+        found_jobs = self.browse()
+        event_vals = []
+        for job, orders in orders_by_job.items():
+            for sale_name, tracking in orders.items():
+                if sale_name not in sale_ids_by_name:
+                    continue
+                found_jobs |= job
+                if not tracking:
+                    continue
+                for sale_id in sale_ids_by_name[sale_name]:
+                    for picking_id in picking_ids_by_sale.get(sale_id, []):
+                        event_vals.append({'picking_id': picking_id, 'job_id': job.id,
+                                           'ftp_type': 'SHIP_IN', 'tracking_number': tracking, 'state': 'ready'})
+        self.env['ftp.event'].create(event_vals)
+        return found_jobs
 
     def parse_ship_in_attachment(self):
-        attachment = self.env['ir.attachment'].search([('res_model','=','ftp.job'),('res_id','=',self.id)])
-        content = base64.b64decode(attachment[0].datas)
-        reader = csv.reader(content.decode('iso-8859-1').split('\n'), delimiter=';')
-        for row in reader:
-            if row:
-                if row[0] == 'ENT':
-                    sale_name = row[3]
-                if row[0] == 'COL':
-                    tracking = row[8].strip()
-        sale = self.env['sale.order'].search([('name','=',sale_name)])
-        if sale:
-            if sale.picking_ids:
-                for pick in sale.picking_ids:
-                    if pick.picking_type_id.id == 2 and tracking:
-                        self.env['ftp.event'].create({'picking_id': pick.id, 'job_id': self.id,
-                                                      'ftp_type': 'SHIP_IN', 'tracking_number': tracking, 'state': 'ready'})
-            return True
-        return False
+        return bool(self._create_ship_in_events())
+
+    def _plan_in_jobs(self):
+        self._create_ship_in_events().write({'state': 'ready'})
 
     def action_plan(self):
+        in_jobs = self.filtered(lambda job: job.ftp_type and 'OUT' not in job.ftp_type and 'IN' in job.ftp_type)
+        if in_jobs:
+            in_jobs._plan_in_jobs()
+        for job in self - in_jobs:
+            job._action_plan()
+
+    def _action_plan(self):
         if self.ftp_type in ['BARCODE_OUT','PRODUCT_OUT']:
             if self.product_ids:
                 self.write({'state': 'progress'})
         elif 'OUT' in self.ftp_type:
             #add events
-            event_ids = self.env['ftp.event'].search([('ftp_type', '=', self.ftp_type),
-                                                      ('create_date', '<=', self.to_datetime),
-                                                      ('create_date', '>=', self.from_datetime),
-                                                      ('job_id','=', False)])
+            with self._measure('plan') as metric:
+                event_ids = self._claim_events()
+                metric['rows'] = len(event_ids)
             if event_ids or self.event_ids:
-                event_ids.write({'job_id': self.id})
                 self.write({'state': 'progress'})
                 self.action_make_file()
             else:
                 self.write({'state': 'done'})
-        elif 'IN' in self.ftp_type:
-            if self.parse_ship_in_attachment():
-                self.write({'state': 'ready'})
         else:
             self.write({'state': 'done'})
 
+    def _claim_events(self):
+        """Assign all the unclaimed events of the job type to the job.
+
+        The events are claimed by a single UPDATE and rows locked by a
+        concurrent claim are skipped instead of waited for, so that jobs
+        planned at the same time never share an event. Returns the events.
+        """
+        self.ensure_one()
+        Event = self.env['ftp.event']
+        Event.flush(['job_id', 'ftp_type'])
+        # ids are allocated before commit: an event may become visible after
+        # one with a higher id was claimed, so the claim can't start from the
+        # cursor and relies on the partial index of the unclaimed events
+        self.env.cr.execute("""
+            UPDATE ftp_event SET job_id = %s, write_uid = %s, write_date = (now() at time zone 'UTC')
+            WHERE id IN (
+                SELECT id FROM ftp_event
+                WHERE ftp_type = %s AND job_id IS NULL
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, (self.id, self.env.uid, self.ftp_type))
+        event_ids = sorted(row[0] for row in self.env.cr.fetchall())
+        Event.invalidate_cache(['job_id', 'write_uid', 'write_date'], event_ids)
+        self.invalidate_cache(['event_ids'], self.ids)
+        if event_ids:
+            self.write({'event_cursor': max(event_ids[-1], self.event_cursor)})
+        return Event.browse(event_ids)
+
+    def _read_by_id(self, model, ids, field_names):
+        ids = [res_id for res_id in ids if res_id]
+        if not ids:
+            return {}
+        return {vals['id']: vals for vals in self.env[model].browse(ids).read(field_names, load=None)}
+
+    def _read_event_pickings(self, picking_fields):
+        """Bulk read the pickings of the job events along with their moves.
+
+        Returns the picking values in event order, then the move and product
+        values keyed by id: each model is read once, so the number of queries
+        does not depend on the number of events.
+        """
+        events = self.event_ids.read(['picking_id'], load=None)
+        picking_ids = [event['picking_id'] for event in events if event['picking_id']]
+        pickings = self._read_by_id('stock.picking', set(picking_ids), picking_fields + ['move_lines'])
+        moves = self._read_by_id('stock.move', [move_id for pick in pickings.values() for move_id in pick['move_lines']],
+                                 ['product_id', 'product_uom_qty'])
+        products = self._read_by_id('product.product', {move['product_id'] for move in moves.values()},
+                                    ['default_code', 'standard_price'])
+        return [pickings[picking_id] for picking_id in picking_ids], moves, products
+
+    def _read_products(self, field_names, batch_size=1000):
+        """Read the job products by batches, yield one dict per product."""
+        products = self.product_ids
+        for index in range(0, len(products), batch_size):
+            yield from products[index:index + batch_size].read(field_names, load=None)
+
     def _prepare_barcode_out_datas(self):
-        datas = []
-        datas.append(['Société/company', 'Entrepôt/warehouse', 'Réservé Spidy/Spidy reserved',
-                      'Client propriétaire/owner code', 'Code produit/product code', 'Code à barre/Barcode',
-                      'Quantité/quantity', 'Code unité/Unit code', 'Adresse email erreurs/Errors email adress'])
         #product_ids = self.env['product.product'].search([('sale_ok', '=', True)])
-        for product in self.product_ids:
-            datas.append(['ASF', 'LVD', '', 'RES', product.default_code, product.barcode, '', '', 'si@projet-resilience.fr'])
-        return datas
+        return FORMATS['BARCODE_OUT'].rows(self._read_products(['default_code', 'barcode']))
 
     def _prepare_product_out_datas(self):
-        datas = []
-        datas.append(['Société', 'Entrepôt', 'Erreurs (réservé Spidy)', 'Client Propriétaire',
-                      'Code Produit (majuscules)', 'Réservé SPIDY', 'Désignation article', 'Caractéristiques articles',
-                      'Référence fournisseur', 'Non utilisé', 'Code Unité de stock', 'Libellé Unt stockage',
-                      'Palettisation', 'Hauteur palette', 'Largeur palette', 'Profondeur palette', 'Poids total palette',
-                      'Code Tri préparation', 'Sous / combien', 'Colisage / par combien', 'Poids unité de stock',
-                      'Gestion des lots', 'Code emballage', 'Non utilisé', 'Non utilisé', 'Non utilisé',
-                      'Prix valorisation', 'Coefficient', 'Code Fournisseur', 'Gamme produit', 'Gestion picking UVC',
-                      'Code unité UVC', 'Libellé unité UVC', 'Typologie stockage reserve', 'Typologie réserve Imposée',
-                      'Typologie stockage picking', 'Typologie picking Imposée', 'Capture Code barre en reception',
-                      'Colisage Unité d\'oeuvre', 'Colisage Hauteur', 'Colisage Largeur', 'Colisage Profondeur',
-                      'UVC unité d\'oeuvre', 'UVC Hauteur', 'UVC Largeur', 'UVC Profondeur', 'Niv colisage', 'Code Kit article',
-                      'Code contrôle article en reception', 'Nb de n° de série', 'Niveau Stock d\'alerte',
-                      'Type de gestion d\'emplacement', 'Code statut produit', 'Code état enregistrement', 'Réservé spidy',
-                      'Réservé spidy', 'Réservé spidy', 'email erreur', 'Mode gestion lot', 'Gestion date 1', 'Gestion date 2', 'Gestion date 3',
-                      'Delai mini entre date rec et dte lot 1', 'Delai mini entre date rec et dte lot 2', 'Delai mini entre date rec et dte lot 3',
-                      'Libell_ date 1', 'Libell_ date 2', 'Libell_ date 3', 'Interdict lot depass', 'Type gestion lot', 'Emplacement Picking fixe',
-                      'Lien HTTP fiche produit', 'Fiche technique ligne 1', 'Fiche technique ligne 2', 'Fiche technique ligne 3', 'Fiche technique ligne 4',
-                      'Fiche technique ligne 5', 'Fiche technique ligne 6', 'Fiche technique ligne 7', 'Fiche technique ligne 8', 'Fiche technique ligne 9',
-                      'Fiche technique ligne 10', 'Fiche technique ligne 11', 'Fiche technique ligne 12', 'Fiche technique ligne 13',
-                      'Fiche technique ligne 14', 'Fiche technique ligne 15', 'Fiche technique ligne 16', 'Fiche technique ligne 17',
-                      'Fiche technique ligne 18', 'Fiche technique ligne 19', 'Fiche technique ligne 20', 'Gamme alcool', 'Degr_ alcool pur',
-                      'Volume effectif (litre)', 'Type gestion d\'alcool', 'R_serv_'])
         #product_ids = self.env['product.product'].search([('sale_ok', '=', True)])
-        for product in self.product_ids:
-            datas.append(['ASF', 'LVD', '', 'RES', product.default_code, '', product.name, '', '', '', 'UN', 'Unité', 1,
-                          '', '', '', '', '', '', 1, product.weight, '', '', '', '', '', product.list_price, 1,
-                          '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '', '',
-                          '', '', '', '2', '', 'AT', '', '', '', 'logistique@projet-resilience.fr',
-                          '', '', '', '', '', '', '', '', '', '', '', '', '',
-                          '', '', '', '', '', '', '', '', '', '', '', '', '',
-                          '', '', '', '', '', '', '', '', '', '', '', '', ''])
-        return datas
+        return FORMATS['PRODUCT_OUT'].rows(self._read_products(['default_code', 'name', 'weight', 'list_price']))
+
+    def _ship_out_values(self):
+        pickings, moves, products = self._read_event_pickings(['sale_id', 'partner_id', 'scheduled_date'])
+        sales = self._read_by_id('sale.order', {pick['sale_id'] for pick in pickings}, ['name'])
+        partners = self._read_by_id('res.partner', {pick['partner_id'] for pick in pickings},
+                                    ['name', 'street', 'street2', 'zip', 'city', 'country_id',
+                                     'email', 'phone', 'parent_id'])
+        partners.update(self._read_by_id('res.partner', {p['parent_id'] for p in partners.values()} - set(partners),
+                                         ['email']))
+        countries = self._read_by_id('res.country', {p.get('country_id') for p in partners.values()}, ['code'])
+        for pick in pickings:
+            partner = partners.get(pick['partner_id'], {})
+            parent = partners.get(partner.get('parent_id'), {})
+            # picking values are shared by its lines, which only update their own keys
+            values = {
+                'order_name': sales.get(pick['sale_id'], {}).get('name', False),
+                'partner_name': partner.get('name'),
+                'street': partner.get('street'),
+                'street2': partner.get('street2'),
+                'zip': partner.get('zip'),
+                'city': partner.get('city'),
+                'country_code': countries.get(partner.get('country_id'), {}).get('code'),
+                'email': parent.get('email') or partner.get('email'),
+                'phone': partner.get('phone'),
+                'scheduled_date': pick['scheduled_date'],
+            }
+            for line_nb, move_id in enumerate(pick['move_lines'], 1):
+                line = moves[move_id]
+                product = products.get(line['product_id'])
+                values['line_nb'] = line_nb
+                values['default_code'] = product and product['default_code']
+                values['standard_price'] = product['standard_price'] if product else None
+                values['quantity'] = line['product_uom_qty']
+                yield values
 
     def _prepare_ship_out_datas(self):
-        datas = []
-        datas.append(['Reserve_Spidy_Spidy_reserved', 'Societe_company', 'Entrepot_Warehouse', 'Numero_commande_client__Order_number',
-                      'Code_client___Customer_code', 'Raison_sociale___Company_name',
-                      'Adresse_livraison_1___Shipping_address_1', 'Adresse_livraison_2___Shipping_address_2', 'Adresse_livraison_3___shipping_address_3',
-                      'Code_postal___Shipping_Postal_Code', 'Ville____Shipping_Town', 'Code_pays___shippping_country_code',
-                      'Initiateur_commande___Order_initiator', 'Commentaire_transport___Shipping_comment_1', 'Commentaire_2___Shipping_Comment_2',
-                      'Commentaire_3___Shipping_comment_2', 'Type_de_commande___Order_type',
-                      'Siecle_livraison___delivery_century', 'Date_livraison___delivery_date',
-                      'Pre_tournee___Shipping_route', 'Tour_de_livraison___Shipping_turn', 'Priorite_missions___Priority',
-                      'Type_date_si_calcul_auto_priorite___Date_type_for_automatic_priority_calculation',
-                      'Type_priorite___Priority_type', 'Passage_par_portefeuille_impose___Force_order_portfolio',
-                      'Type_de_mouvement___Order_type_of_stock', 'Mention_etiquette_expedition___Shipping_label_header',
-                      'Contre_remboursement_ou_assurance___Payment_at_delivery_time_or_insurance',
-                      'Montant_contre_remboursement__ou_assurance___Amount_to_be_paid_at_delivery_time_or_insurance_amount',
-                      'Mode_de_tri_preparation_assistee___Picking_sort_type', 'Code_expediteur_EDI___EDI_shipping_account',
-                      'Numero_de_ligne___Line_number', 'Code_article___Product_code',
-                      'Numero_de_lot___Batch_number', 'Quantite_a_expedier___Quantity_to_ship',
-                      'Reserve_Spidy_Spidy_reserved1', 'Commentaire_ligne_produit___Product_line_comment', 'Prix_unitaire_valorisation___Sale_price_for_labels',
-                      'Adresse_email_erreur___Error_email_address',
-                      'Adresse_alternative_1___Alternate_address_1', 'Adresse_alternative_2___Alternate_address_2',
-                      'Adresse_alternative_3___Alternate_address_3', 'Adresse_alternative_4___Alternate_address_4',
-                      'Adresse_alternative___code_postal___Alternate_address___zip_code','Adresse_alternative___ville___Alternate_Address___City',
-                      'Adresse_alternative___code_pays___Alternate_address___Country', 'Code_porte___Gate_code', 'Code_porte_2___Gate_code_2',
-                      'Interphone___Intercom', 'Telephone_Portable___Cellular_phone', 'Telephone_fixe___Fixed_phone',
-                      'Zone_complementaire_specifique_transporteur_Carrier_complement', 'Commentaire_commande_complementaire_1___Order_additionnal_comment_1',
-                      'Impression_commentaire_comp_1_sur_BL___print_additionnal_comment_1_on_delivery_note',
-                      'Commentaire_commande_complementaire_2___Order_additionnal_comment_2',
-                      'Impression_commentaire_comp_2_sur_BL___print_additionnal_comment_2_on_delivery_note',
-                      'Commentaire_commande_complementaire_3___Order_additionnal_comment_3',
-                      'Impression_commentaire_comp_3_sur_BL___print_additionnal_comment_3_on_delivery_note',
-                      'Commentaire_commande_complementaire_4___Order_additionnal_comment_4',
-                      'Impression_commentaire_comp_4_sur_BL___print_additionnal_comment_4_on_delivery_note',
-                      'Commentaire_commande_complementaire_5___Order_additionnal_comment_5',
-                      'Impression_commentaire_comp_5_sur_BL___print_additionnal_comment_5_on_delivery_note',
-                      'Destinataire_commande___Order_consignee', 'Type_de_client___Customer_type', 'Identifiant_1___identifier_1',
-                      'Identifiant_2___identifier_2', 'Identifiant_3___identifier_3', 'Type_d_adresse___Adress_type', 'Code_agence___Agency_code'])
-        for event in self.event_ids:
-            pick = event.picking_id
-            line_nb = 0
-            for line in pick.move_lines:
-                line_nb += 1
-                sale = pick.sale_id
-                partner = pick.partner_id
-                datas.append(['', 'ASF', 'LVD', sale.name, 'RES', partner.name or '', partner.street or '', partner.street2 or '', '',
-                              partner.zip or '', partner.city or '', partner.country_id and partner.country_id.code or '',
-                              '', '', partner.parent_id and partner.parent_id.email or partner.email or '', '', '', 1,
-                              pick.scheduled_date and (pick.scheduled_date.strftime('%y%m%d')) or '',
-                              'CPTR', '', '', '', '', '', '1', '', '', '', '', 'RES',
-                              line_nb, line.product_id and line.product_id.default_code or '', '', int(line.product_uom_qty) or '', '', '',
-                              line.product_id and str(line.product_id.standard_price).replace('.',',') or '0,0',
-                              'logistique@projet-resilience.fr','','','','','','','','','','',
-                              partner.phone or '', '','','','','','','','','','','','','','','','','','',''])
-        return datas
+        return FORMATS['SHIP_OUT'].rows(self._ship_out_values())
+
+    def _rec_out_values(self):
+        pickings, moves, products = self._read_event_pickings(['name'])
+        for pick in pickings:
+            values = {'picking_name': pick['name']}
+            for move_id in pick['move_lines']:
+                line = moves[move_id]
+                values['default_code'] = products.get(line['product_id'], {}).get('default_code', False)
+                values['quantity'] = line['product_uom_qty']
+                yield values
 
     def _prepare_rec_out_datas(self):
-        datas = []
-        datas.append(['Réservé SPIDY', 'Société', 'Entrepôt', 'Type d\'entrée', 'Nature de l\'entrée marchandise',
-                      'N° de reference de l\'entrée attendue', 'Siecle', 'Date entrée prévisionnelle', 'Raison sociale vendeur',
-                      'Client propriétaire', 'Flag suppression entrée previ', 'Code fournisseur', 'Retour : code client',
-                      'Retour : adresse 1', 'Retour : adresse 2', 'Retour : adresse 3', 'Retour : code postal',
-                      'Retour : ville', 'Retour : Pays', 'retour : commentaire', 'Code article', 'Quantité', 'adresse email erreur'])
-        for event in self.event_ids:
-            pick = event.picking_id
-            for line in pick.move_lines:
-                datas.append(['', 'ASF', 'ATS', 'R', '', 'ATE/' + pick.name, '' , '', '', 'RES', '',
-                              line.product_id.default_code, '', '', '', '', '', '', '', '',
-                              line.product_id.default_code, line.product_uom_qty, 'logistique@projet-resilience.fr'])
-        return datas
+        return FORMATS['REC_OUT'].rows(self._rec_out_values())
 
     def _prepare_datas(self):
         if self.ftp_type == 'BARCODE_OUT':
@@ -327,28 +838,102 @@ class FtpJob(models.Model):
         elif self.ftp_type == 'REC_OUT':
             datas = self._prepare_rec_out_datas()
         else:
-            datas = []
+            datas = iter(())
         return datas
 
+    def _write_csv_file(self, rows):
+        """Encode rows to a temporary file, returns (file, number of rows)."""
+        tmp = tempfile.TemporaryFile()
+        wrapper = io.TextIOWrapper(tmp, encoding='iso-8859-1', newline='')
+        writer = csv.writer(wrapper, delimiter=';', quotechar='"')
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        wrapper.flush()
+        wrapper.detach()
+        tmp.seek(0)
+        return tmp, count
+
+    def _create_file_attachment(self, name, stream, mimetype=None, compress=False):
+        """Store a binary stream as an attachment of the job, chunk by chunk.
+
+        The file is copied straight into the filestore instead of going
+        through the base64 ``datas`` field, so the content is never held
+        in memory as a whole. With ``compress``, it is stored gzipped.
+        """
+        Attachment = self.env['ir.attachment']
+        if compress:
+            stream = gzip_stream(stream)
+            name += GZIP_SUFFIX
+            mimetype = GZIP_MIMETYPE
+        values = {
+            'name': name,
+            'type': 'binary',
+            'res_id': self.id,
+            'res_model': 'ftp.job',
+        }
+        if mimetype:
+            values['mimetype'] = mimetype
+        if Attachment._storage() == 'db':
+            values['datas'] = base64.b64encode(stream.read())
+            return Attachment.create(values)
+        checksum, size = stream_checksum(stream)
+        fname = checksum[:2] + '/' + checksum
+        full_path = Attachment._full_path(fname)
+        if not os.path.isfile(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'wb') as f:
+                shutil.copyfileobj(stream, f, FILE_CHUNK_SIZE)
+            Attachment._mark_for_gc(fname)
+        values['store_fname'] = fname
+        attachment = Attachment.create(values)
+        # file_size and checksum are dropped by ir.attachment create/write
+        self.env.cr.execute("UPDATE ir_attachment SET file_size = %s, checksum = %s WHERE id = %s",
+                            (size, checksum, attachment.id))
+        attachment.invalidate_cache(['file_size', 'checksum'])
+        return attachment
+
+    def _open_attachment(self, attachment):
+        """Open an attachment of the jobs as an uncompressed binary stream."""
+        compressed = attachment.mimetype == GZIP_MIMETYPE
+        if attachment.store_fname:
+            full_path = attachment._full_path(attachment.store_fname)
+            return gzip.open(full_path, 'rb') if compressed else open(full_path, 'rb')
+        content = base64.b64decode(attachment.datas or b'')
+        return io.BytesIO(gzip.decompress(content) if compressed else content)
+
+    def _last_sent_checksum(self):
+        last_job = self.search([('ftp_type', '=', self.ftp_type), ('backend_id', '=', self.backend_id.id),
+                                ('state', '=', 'done'), ('id', '!=', self.id)], order='id desc', limit=1)
+        return last_job.file_checksum
+
     def action_make_file(self):
-        datas = self._prepare_datas()
-        if datas:
-            f = io.StringIO()
-            writer = csv.writer(f, delimiter=';', quotechar='"')
-            for data in datas:
-                writer.writerow(data)
-            content = base64.encodebytes(f.getvalue().encode('iso-8859-1'))
-            tz = pytz.timezone('Europe/Paris')
-            to_datetime = pytz.utc.localize(self.to_datetime).astimezone(tz)
-            attachment = self.env['ir.attachment'].create({
-                'datas': content,
-                'name': self.ftp_type + ' ' + to_datetime.strftime("%Y-%m-%d %H:%M:%S") + '.csv',
-                'type': 'binary',
-                'res_id': self.id,
-                'res_model': 'ftp.job'
-            })
-            self.write({'state': 'ready'})
-            self.event_ids.write({'state': 'ready'})
+        generate = {'duration': 0.0, 'queries': 0}
+        start = time.perf_counter()
+        stream, count = self._write_csv_file(timed_rows(self._prepare_datas(), self.env.cr, generate))
+        with stream:
+            size = stream.seek(0, io.SEEK_END)
+            stream.seek(0)
+            if count:
+                checksum = stream_checksum(stream)[0]
+                if self.ftp_type in EXPORT_WATERMARKS and checksum == self._last_sent_checksum():
+                    # Spidy already has this exact file, only move the export date
+                    _logger.info('%s is identical to the last file sent, skipped', self.name)
+                    self._update_export_watermarks()
+                    self.unlink()
+                    return
+                tz = pytz.timezone('Europe/Paris')
+                to_datetime = pytz.utc.localize(self.to_datetime).astimezone(tz)
+                self._create_file_attachment(
+                    self.ftp_type + ' ' + to_datetime.strftime("%Y-%m-%d %H:%M:%S") + '.csv', stream, 'text/csv',
+                    compress=self._get_backend().compress_files)
+                self.write({'state': 'ready', 'file_checksum': checksum, 'file_rows': count, 'file_size': size})
+                self.event_ids.write({'state': 'ready'})
+        # encoding covers writing the rows and storing the file
+        self._record_metrics('generate', dict(generate, rows=count))
+        self._record_metrics('encode', {'duration': time.perf_counter() - start - generate['duration'],
+                                        'rows': count, 'bytes': size})
 
     """def make_file2(self):
         home = '/tmp/'
@@ -369,70 +954,167 @@ class FtpJob(models.Model):
         ftp.login(user=backend.username, passwd=backend.password)
         return ftp"""
 
+    def _get_backend(self):
+        return self[:1].backend_id or self.env['ftp.backend'].search([], limit=1)
+
     def action_receive_files(self, remote_path, ftp_type):
-        backend = self.env['ftp.backend'].search([],limit=1)
-        host,port = backend.host,backend.port
-        transport = paramiko.Transport((host,port))
-        transport.connect(None, backend.username, backend.password)
-        sftp = paramiko.SFTPClient.from_transport(transport)
-        filenames = sftp.listdir('/RES/IN/RES/CR_PRE/')
-        for filename in filenames:
-            sftp.get('/RES/IN/RES/CR_PRE/' + filename, '/tmp/' + filename)
-        for filename in filenames:
-            att_id = self.env['ir.attachment'].search([('name','=',filename),('res_model','=','ftp.job')])
-            if not att_id:
-                with open('/tmp/' + filename, 'rb') as f:
-                    content = f.read()
+        """Import the new files of ``remote_path``, the incoming directory of the backend by default."""
+        backend = self._get_backend()
+        transport = backend._get_transport()
+        remote_dir = remote_path or backend.in_path
+        if not remote_dir.endswith('/'):
+            remote_dir += '/'
+        with measure(self.env.cr) as connection:
+            entries = transport.listdir(remote_dir)
+        RemoteFile = self.env['ftp.remote.file']
+        to_fetch = RemoteFile._get_files_to_fetch(backend, remote_dir, entries)
+        new_jobs, manifest_vals, imported = self.browse(), [], []
+        planning = {'duration': 0.0, 'queries': 0}
+        # files are stored and planned as soon as they are downloaded, while
+        # the remaining ones are still being transferred
+        downloads = backend._download_files(transport, [remote_dir + name for name in to_fetch])
+        with measure(self.env.cr) as transfer, closing(downloads):
+            for path, stream in downloads:
+                with stream:
+                    filename = path.rsplit('/', 1)[-1]
+                    entry, remote_file = to_fetch[filename]
+                    checksum, size = stream_checksum(stream)
+                    transfer['bytes'] += size
+                    vals = {'size': entry.st_size, 'mtime': entry.st_mtime, 'checksum': checksum}
+                    if remote_file and remote_file.checksum == checksum:
+                        remote_file.write(vals)
+                        continue
                     job_id = self.create({'ftp_type': ftp_type,
+                                          'name': filename,
+                                          'backend_id': backend.id,
                                           'to_datetime': fields.Datetime.now(),
+                                          'file_checksum': checksum,
+                                          'file_size': size,
                                           'state': 'draft'})
-                    attachment = self.env['ir.attachment'].create({
-                        'datas': base64.b64encode(content),
-                        'name': filename,
-                        'type': 'binary',
-                        'res_id': job_id,
-                        'res_model': 'ftp.job'
-                    })
-                    job_id.action_plan()
+                    job_id._create_file_attachment(filename, stream, compress=backend.compress_files)
+                    vals['job_id'] = job_id.id
+                    if remote_file:
+                        remote_file.write(vals)
+                    else:
+                        manifest_vals.append(dict(vals, backend_id=backend.id, path=remote_dir, name=filename))
+                    imported.append(filename)
+                    new_jobs |= job_id
+                    with measure(self.env.cr) as plan:
+                        job_id.action_plan()
+                    planning['duration'] += plan['duration']
+                    planning['queries'] += plan['queries']
+        # the planning has its own metrics
+        transfer['duration'] -= planning['duration']
+        transfer['queries'] -= planning['queries']
+        RemoteFile.create(manifest_vals)
+        new_jobs._record_metrics('connect', connection)
+        new_jobs._record_metrics('transfer', transfer)
+        if backend.archive_path and imported:
+            # moved by a queue job, only enqueued once the jobs of the files are committed
+            new_jobs._delay('root.spidy.in')._job_archive_files(remote_dir, imported)
         return True
 
-    def action_send_file(self):
-        backend = self.env['ftp.backend'].search([],limit=1)
-        host,port = backend.host,backend.port
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(host, port, backend.username, backend.password)
-        sftp = ssh.open_sftp()
+    def action_archive_files(self, remote_dir, filenames):
+        """Move imported files of ``remote_dir`` to the archive directory of the backend.
 
-        attachment = self.env['ir.attachment'].search([('res_model', '=', 'ftp.job'),
-                                                       ('res_id', '=', self.id)],
-                                                      order='id desc', limit=1)
-        remote_path = '/RES/OUT/' + attachment.name.replace(' ','_').replace(':','')
-        local_path = attachment._full_path(attachment.store_fname)
+        Files which are no longer in ``remote_dir`` are skipped, so that a
+        retry does not fail on the ones already moved.
+        """
+        backend = self._get_backend()
+        if not backend.archive_path:
+            return True
+        transport = backend._get_transport()
+        archive_dir = backend.archive_path.rstrip('/') + '/'
+        present = {entry.filename for entry in transport.listdir(remote_dir)}
+        for filename in filenames:
+            if filename in present:
+                transport.rename(remote_dir + filename, archive_dir + filename)
+        return True
 
-        sftp.put(local_path, remote_path)
+    def _get_file_attachment(self):
+        self.ensure_one()
+        return self.env['ir.attachment'].search([('res_model', '=', 'ftp.job'),
+                                                 ('res_id', '=', self.id)],
+                                                order='id desc', limit=1)
 
-        sftp.close()
-        ssh.close()
+    def _send_files(self):
+        """Upload the files of the jobs in parallel.
+
+        Returns the jobs whose file was sent and a dict of the errors
+        raised for the other ones.
+        """
+        backend = self._get_backend()
+        out_dir = backend.out_path.rstrip('/') + '/'
+        transfers, size = {}, 0
+        for job in self:
+            attachment = job._get_file_attachment()
+            size += job.file_size or attachment.file_size
+            compressed = attachment.mimetype == GZIP_MIMETYPE
+            name = attachment.name[:-len(GZIP_SUFFIX)] if compressed else attachment.name
+            remote_path = out_dir + name.replace(' ','_').replace(':','')
+            transfers[(attachment._full_path(attachment.store_fname), remote_path, compressed)] = job
+        transport = backend._get_transport()
+        with self._measure('connect'):
+            # opens the connection (the pooled SFTP session) before the workers share it
+            transport.connect()
+        sent, errors = self.browse(), {}
+        with self._measure('transfer') as metric:
+            for transfer, error in backend._upload_files(transport, list(transfers)):
+                job = transfers[transfer]
+                if error:
+                    _logger.error('Upload of %s failed: %s', transfer[1], error)
+                    errors[job] = error
+                else:
+                    sent |= job
+            metric['bytes'] = size
+        return sent, errors
+
+    def action_send_file(self):
+        sent, errors = self._send_files()
+        if errors:
+            raise next(iter(errors.values()))
 
     def action_ready(self):
         for event in self.event_ids:
             event.write({'state': 'ready'})
 
     def action_done(self):
-        if 'OUT' in self.ftp_type:
-            self.action_send_file()
-            for event in self.event_ids:
-                event.action_done()
-            self.write({'state': 'done'})
-        elif 'SHIP_IN' in self.ftp_type:
-            for event in self.event_ids:
-                event.action_done()
-            if all(event.state == 'done' for event in self.event_ids):
-                self.write({'state': 'done'})
-        elif 'IN' in self.ftp_type:
-            if all(event.state == "done" for event in self.event_ids):
-                self.write({'state': 'done'})
+        out_jobs = self.filtered(lambda job: 'OUT' in job.ftp_type)
+        if len(out_jobs) > 1:
+            # several files to upload: send them in parallel and leave
+            # the jobs which could not be sent ready for the next run
+            sent, errors = out_jobs._send_files()
+            network_errors = [error for error in errors.values() if isinstance(error, NETWORK_ERRORS)]
+            if network_errors:
+                # the queue job retries the whole batch, the files sent are
+                # uploaded again under the same names
+                raise network_errors[0]
+            for job, error in errors.items():
+                job.message_post(body=str(error))
+            (self - (out_jobs - sent))._action_done()
+            return
+        if out_jobs:
+            out_jobs.action_send_file()
+        self._action_done()
+
+    def _action_done(self):
+        out_jobs = self.filtered(lambda job: 'OUT' in job.ftp_type)
+        ship_in_jobs = self.filtered(lambda job: job.ftp_type == 'SHIP_IN')
+        out_jobs.mapped('event_ids').action_done()
+        with ship_in_jobs._measure('validate') as metric:
+            ship_in_events = ship_in_jobs.mapped('event_ids')
+            ship_in_events.action_done()
+            metric['rows'] = len(ship_in_events)
+        in_jobs = (self - out_jobs).filtered(lambda job: all(event.state == 'done' for event in job.event_ids))
+        (out_jobs | in_jobs).write({'state': 'done'})
+        out_jobs._update_export_watermarks()
+
+    def _update_export_watermarks(self):
+        for job in self.filtered(lambda job: job.ftp_type in EXPORT_WATERMARKS):
+            backend = job._get_backend()
+            field_name = EXPORT_WATERMARKS[job.ftp_type]
+            if not backend[field_name] or backend[field_name] < job.to_datetime:
+                backend.write({field_name: job.to_datetime})
 
 
 class StockPicking(models.Model):
@@ -440,17 +1122,17 @@ class StockPicking(models.Model):
 
     event_ids = fields.One2many('ftp.event', 'picking_id', 'Events')
 
-    @api.depends('move_type', 'immediate_transfer', 'move_lines.state', 'move_lines.picking_id')
-    def _compute_state(self):
-        super(StockPicking, self)._compute_state()
-        for picking in self:
-            if picking.move_lines:
-                if picking.picking_type_id.id == 2:
-                    relevant_move_state = picking.move_lines._get_relevant_state_among_moves()
-                    if relevant_move_state == 'assigned':
-                        self.env['ftp.event'].create({'name': picking.name,
-                                                      'picking_id': picking.id,
-                                                      'ftp_type': 'SHIP_OUT'})
+
+class StockMove(models.Model):
+    _inherit = 'stock.move'
+
+    def _action_assign(self):
+        res = super(StockMove, self)._action_assign()
+        pickings = self.mapped('picking_id').filtered(
+            lambda picking: picking.picking_type_id.id == 2
+            and picking.move_lines._get_relevant_state_among_moves() == 'assigned')
+        self.env['ftp.event']._create_open_events(pickings, 'SHIP_OUT')
+        return res
 
      #stock.picking, action_done
      #purchase.order, button_approve
@@ -0,0 +1,334 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+"""Column layouts of the files exchanged with Spidy.
+
+Each OUT format is a list of :class:`Column` compiled once into a row
+template: building a row copies the template and only sets the columns
+having a source. IN formats map each record type (first column of the
+row) to the fields read from it, and are read one group of records
+(an order and its lines) at a time.
+"""
+
+
+class Column(object):
+    """A column of an OUT file.
+
+    ``source`` is the key read from the values of the row, converted by
+    ``formatter`` when given. Columns without source always hold ``default``.
+    """
+    __slots__ = ('name', 'source', 'formatter', 'default')
+
+    def __init__(self, name, source=None, formatter=None, default=''):
+        self.name = name
+        self.source = source
+        self.formatter = formatter
+        self.default = default
+
+
+class FileFormat(object):
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.header = [column.name for column in columns]
+        self._template = [column.default for column in columns]
+        self._fillers = tuple((index, column.source, column.formatter)
+                              for index, column in enumerate(columns) if column.source)
+
+    def build_row(self, values):
+        row = self._template[:]
+        for index, source, formatter in self._fillers:
+            value = values[source]
+            row[index] = formatter(value) if formatter else value
+        return row
+
+    def rows(self, values_list):
+        """Yield the header, then a row for each mapping of values."""
+        yield self.header
+        build_row = self.build_row
+        for values in values_list:
+            yield build_row(values)
+
+
+class Field(object):
+    """A field of an IN record, read at ``index`` and converted by ``parser``."""
+    __slots__ = ('name', 'index', 'parser')
+
+    def __init__(self, name, index, parser=None):
+        self.name = name
+        self.index = index
+        self.parser = parser
+
+
+class RecordFormat(object):
+    """Record types of an IN file, grouped under each ``group_type`` record."""
+
+    def __init__(self, records, group_type='ENT'):
+        self.records = records
+        self.group_type = group_type
+
+    def parse(self, rows):
+        """Yield ``(record type, values)`` for the known records of the rows."""
+        records = self.records
+        for row in rows:
+            if not row or row[0] not in records:
+                continue
+            values = {}
+            for field in records[row[0]]:
+                value = row[field.index] if field.index < len(row) else ''
+                values[field.name] = field.parser(value) if field.parser else value
+            yield row[0], values
+
+    def groups(self, rows):
+        """Yield ``(group values, [(record type, values), ...])`` per group.
+
+        Records before the first group record are ignored. Only the current
+        group is held in memory, whatever the size of the file.
+        """
+        group, records = None, []
+        for record_type, values in self.parse(rows):
+            if record_type == self.group_type:
+                if group is not None:
+                    yield group, records
+                group, records = values, []
+            elif group is not None:
+                records.append((record_type, values))
+        if group is not None:
+            yield group, records
+
+
+def text(value):
+    return value or ''
+
+
+def integer(value):
+    return int(value) or ''
+
+
+def short_date(value):
+    return value and value.strftime('%y%m%d') or ''
+
+
+def decimal_comma(value):
+    return '0,0' if value is None else str(value).replace('.', ',')
+
+
+def expected_entry_ref(value):
+    return 'ATE/' + value
+
+
+FORMATS = {}
+
+FORMATS['BARCODE_OUT'] = FileFormat([
+    Column('Société/company', default='ASF'),
+    Column('Entrepôt/warehouse', default='LVD'),
+    Column('Réservé Spidy/Spidy reserved'),
+    Column('Client propriétaire/owner code', default='RES'),
+    Column('Code produit/product code', 'default_code'),
+    Column('Code à barre/Barcode', 'barcode'),
+    Column('Quantité/quantity'),
+    Column('Code unité/Unit code'),
+    Column('Adresse email erreurs/Errors email adress', default='si@projet-resilience.fr'),
+])
+
+FORMATS['PRODUCT_OUT'] = FileFormat([
+    Column('Société', default='ASF'),
+    Column('Entrepôt', default='LVD'),
+    Column('Erreurs (réservé Spidy)'),
+    Column('Client Propriétaire', default='RES'),
+    Column('Code Produit (majuscules)', 'default_code'),
+    Column('Réservé SPIDY'),
+    Column('Désignation article', 'name'),
+    Column('Caractéristiques articles'),
+    Column('Référence fournisseur'),
+    Column('Non utilisé'),
+    Column('Code Unité de stock', default='UN'),
+    Column('Libellé Unt stockage', default='Unité'),
+    Column('Palettisation', default=1),
+    Column('Hauteur palette'),
+    Column('Largeur palette'),
+    Column('Profondeur palette'),
+    Column('Poids total palette'),
+    Column('Code Tri préparation'),
+    Column('Sous / combien'),
+    Column('Colisage / par combien', default=1),
+    Column('Poids unité de stock', 'weight'),
+    Column('Gestion des lots'),
+    Column('Code emballage'),
+    Column('Non utilisé'),
+    Column('Non utilisé'),
+    Column('Non utilisé'),
+    Column('Prix valorisation', 'list_price'),
+    Column('Coefficient', default=1),
+    Column('Code Fournisseur'),
+    Column('Gamme produit'),
+    Column('Gestion picking UVC'),
+    Column('Code unité UVC'),
+    Column('Libellé unité UVC'),
+    Column('Typologie stockage reserve'),
+    Column('Typologie réserve Imposée'),
+    Column('Typologie stockage picking'),
+    Column('Typologie picking Imposée'),
+    Column('Capture Code barre en reception'),
+    Column("Colisage Unité d'oeuvre"),
+    Column('Colisage Hauteur'),
+    Column('Colisage Largeur'),
+    Column('Colisage Profondeur'),
+    Column("UVC unité d'oeuvre"),
+    Column('UVC Hauteur'),
+    Column('UVC Largeur'),
+    Column('UVC Profondeur'),
+    Column('Niv colisage'),
+    Column('Code Kit article'),
+    Column('Code contrôle article en reception'),
+    Column('Nb de n° de série'),
+    Column("Niveau Stock d'alerte"),
+    Column("Type de gestion d'emplacement", default='2'),
+    Column('Code statut produit'),
+    Column('Code état enregistrement', default='AT'),
+    Column('Réservé spidy'),
+    Column('Réservé spidy'),
+    Column('Réservé spidy'),
+    Column('email erreur', default='logistique@projet-resilience.fr'),
+    Column('Mode gestion lot'),
+    Column('Gestion date 1'),
+    Column('Gestion date 2'),
+    Column('Gestion date 3'),
+    Column('Delai mini entre date rec et dte lot 1'),
+    Column('Delai mini entre date rec et dte lot 2'),
+    Column('Delai mini entre date rec et dte lot 3'),
+    Column('Libell_ date 1'),
+    Column('Libell_ date 2'),
+    Column('Libell_ date 3'),
+    Column('Interdict lot depass'),
+    Column('Type gestion lot'),
+    Column('Emplacement Picking fixe'),
+    Column('Lien HTTP fiche produit'),
+    Column('Fiche technique ligne 1'),
+    Column('Fiche technique ligne 2'),
+    Column('Fiche technique ligne 3'),
+    Column('Fiche technique ligne 4'),
+    Column('Fiche technique ligne 5'),
+    Column('Fiche technique ligne 6'),
+    Column('Fiche technique ligne 7'),
+    Column('Fiche technique ligne 8'),
+    Column('Fiche technique ligne 9'),
+    Column('Fiche technique ligne 10'),
+    Column('Fiche technique ligne 11'),
+    Column('Fiche technique ligne 12'),
+    Column('Fiche technique ligne 13'),
+    Column('Fiche technique ligne 14'),
+    Column('Fiche technique ligne 15'),
+    Column('Fiche technique ligne 16'),
+    Column('Fiche technique ligne 17'),
+    Column('Fiche technique ligne 18'),
+    Column('Fiche technique ligne 19'),
+    Column('Fiche technique ligne 20'),
+    Column('Gamme alcool'),
+    Column('Degr_ alcool pur'),
+    Column('Volume effectif (litre)'),
+    Column("Type gestion d'alcool"),
+    Column('R_serv_'),
+])
+
+FORMATS['SHIP_OUT'] = FileFormat([
+    Column('Reserve_Spidy_Spidy_reserved'),
+    Column('Societe_company', default='ASF'),
+    Column('Entrepot_Warehouse', default='LVD'),
+    Column('Numero_commande_client__Order_number', 'order_name'),
+    Column('Code_client___Customer_code', default='RES'),
+    Column('Raison_sociale___Company_name', 'partner_name', text),
+    Column('Adresse_livraison_1___Shipping_address_1', 'street', text),
+    Column('Adresse_livraison_2___Shipping_address_2', 'street2', text),
+    Column('Adresse_livraison_3___shipping_address_3'),
+    Column('Code_postal___Shipping_Postal_Code', 'zip', text),
+    Column('Ville____Shipping_Town', 'city', text),
+    Column('Code_pays___shippping_country_code', 'country_code', text),
+    Column('Initiateur_commande___Order_initiator'),
+    Column('Commentaire_transport___Shipping_comment_1'),
+    Column('Commentaire_2___Shipping_Comment_2', 'email', text),
+    Column('Commentaire_3___Shipping_comment_2'),
+    Column('Type_de_commande___Order_type'),
+    Column('Siecle_livraison___delivery_century', default=1),
+    Column('Date_livraison___delivery_date', 'scheduled_date', short_date),
+    Column('Pre_tournee___Shipping_route', default='CPTR'),
+    Column('Tour_de_livraison___Shipping_turn'),
+    Column('Priorite_missions___Priority'),
+    Column('Type_date_si_calcul_auto_priorite___Date_type_for_automatic_priority_calculation'),
+    Column('Type_priorite___Priority_type'),
+    Column('Passage_par_portefeuille_impose___Force_order_portfolio'),
+    Column('Type_de_mouvement___Order_type_of_stock', default='1'),
+    Column('Mention_etiquette_expedition___Shipping_label_header'),
+    Column('Contre_remboursement_ou_assurance___Payment_at_delivery_time_or_insurance'),
+    Column('Montant_contre_remboursement__ou_assurance___Amount_to_be_paid_at_delivery_time_or_insurance_amount'),
+    Column('Mode_de_tri_preparation_assistee___Picking_sort_type'),
+    Column('Code_expediteur_EDI___EDI_shipping_account', default='RES'),
+    Column('Numero_de_ligne___Line_number', 'line_nb'),
+    Column('Code_article___Product_code', 'default_code', text),
+    Column('Numero_de_lot___Batch_number'),
+    Column('Quantite_a_expedier___Quantity_to_ship', 'quantity', integer),
+    Column('Reserve_Spidy_Spidy_reserved1'),
+    Column('Commentaire_ligne_produit___Product_line_comment'),
+    Column('Prix_unitaire_valorisation___Sale_price_for_labels', 'standard_price', decimal_comma),
+    Column('Adresse_email_erreur___Error_email_address', default='logistique@projet-resilience.fr'),
+    Column('Adresse_alternative_1___Alternate_address_1'),
+    Column('Adresse_alternative_2___Alternate_address_2'),
+    Column('Adresse_alternative_3___Alternate_address_3'),
+    Column('Adresse_alternative_4___Alternate_address_4'),
+    Column('Adresse_alternative___code_postal___Alternate_address___zip_code'),
+    Column('Adresse_alternative___ville___Alternate_Address___City'),
+    Column('Adresse_alternative___code_pays___Alternate_address___Country'),
+    Column('Code_porte___Gate_code'),
+    Column('Code_porte_2___Gate_code_2'),
+    Column('Interphone___Intercom'),
+    Column('Telephone_Portable___Cellular_phone', 'phone', text),
+    Column('Telephone_fixe___Fixed_phone'),
+    Column('Zone_complementaire_specifique_transporteur_Carrier_complement'),
+    Column('Commentaire_commande_complementaire_1___Order_additionnal_comment_1'),
+    Column('Impression_commentaire_comp_1_sur_BL___print_additionnal_comment_1_on_delivery_note'),
+    Column('Commentaire_commande_complementaire_2___Order_additionnal_comment_2'),
+    Column('Impression_commentaire_comp_2_sur_BL___print_additionnal_comment_2_on_delivery_note'),
+    Column('Commentaire_commande_complementaire_3___Order_additionnal_comment_3'),
+    Column('Impression_commentaire_comp_3_sur_BL___print_additionnal_comment_3_on_delivery_note'),
+    Column('Commentaire_commande_complementaire_4___Order_additionnal_comment_4'),
+    Column('Impression_commentaire_comp_4_sur_BL___print_additionnal_comment_4_on_delivery_note'),
+    Column('Commentaire_commande_complementaire_5___Order_additionnal_comment_5'),
+    Column('Impression_commentaire_comp_5_sur_BL___print_additionnal_comment_5_on_delivery_note'),
+    Column('Destinataire_commande___Order_consignee'),
+    Column('Type_de_client___Customer_type'),
+    Column('Identifiant_1___identifier_1'),
+    Column('Identifiant_2___identifier_2'),
+    Column('Identifiant_3___identifier_3'),
+    Column('Type_d_adresse___Adress_type'),
+    Column('Code_agence___Agency_code'),
+])
+
+FORMATS['REC_OUT'] = FileFormat([
+    Column('Réservé SPIDY'),
+    Column('Société', default='ASF'),
+    Column('Entrepôt', default='ATS'),
+    Column("Type d'entrée", default='R'),
+    Column("Nature de l'entrée marchandise"),
+    Column("N° de reference de l'entrée attendue", 'picking_name', expected_entry_ref),
+    Column('Siecle'),
+    Column('Date entrée prévisionnelle'),
+    Column('Raison sociale vendeur'),
+    Column('Client propriétaire', default='RES'),
+    Column('Flag suppression entrée previ'),
+    Column('Code fournisseur', 'default_code'),
+    Column('Retour : code client'),
+    Column('Retour : adresse 1'),
+    Column('Retour : adresse 2'),
+    Column('Retour : adresse 3'),
+    Column('Retour : code postal'),
+    Column('Retour : ville'),
+    Column('Retour : Pays'),
+    Column('retour : commentaire'),
+    Column('Code article', 'default_code'),
+    Column('Quantité', 'quantity'),
+    Column('adresse email erreur', default='logistique@projet-resilience.fr'),
+])
+
+FORMATS['SHIP_IN'] = RecordFormat({
+    'ENT': [Field('order_name', 3)],
+    'COL': [Field('tracking', 8, str.strip)],
+})
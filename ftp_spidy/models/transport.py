@@ -0,0 +1,189 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import calendar
+import ftplib
+import gzip
+import os
+import shutil
+import socket
+import tempfile
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import paramiko
+
+from .sftp_pool import SFTP_POOL
+
+FILE_CHUNK_SIZE = 64 * 1024
+# downloaded files bigger than this are spooled to disk
+SPOOL_SIZE = 1024 * 1024
+# transient errors worth retrying the transfer for; a missing file, a denied
+# permission or a full disk fail the same way on the next attempt
+NETWORK_ERRORS = (socket.timeout, ConnectionError, EOFError, paramiko.SSHException, ftplib.error_temp)
+
+# what the jobs need from a directory listing, whatever the driver
+RemoteEntry = namedtuple('RemoteEntry', ['filename', 'st_size', 'st_mtime', 'st_mode'])
+
+
+def _open_local(local_path, compressed):
+    return gzip.open(local_path, 'rb') if compressed else open(local_path, 'rb')
+
+
+class SFTPDriver(object):
+    """Transfers through the pooled SFTP sessions of a backend.
+
+    With ``pipelined``, uploads don't wait for each write to be acknowledged
+    and downloads prefetch the file; some servers handle that poorly.
+    """
+
+    def __init__(self, pool_args, pipelined=True):
+        self.pool_args = pool_args
+        self.pipelined = pipelined
+
+    def connect(self):
+        with SFTP_POOL.channel(*self.pool_args):
+            pass
+
+    def close(self):
+        SFTP_POOL.close(self.pool_args[0])
+
+    def listdir(self, path):
+        with SFTP_POOL.channel(*self.pool_args) as sftp:
+            return sftp.listdir_attr(path)
+
+    def download(self, remote_path):
+        stream = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            with SFTP_POOL.channel(*self.pool_args) as sftp:
+                if self.pipelined:
+                    sftp.getfo(remote_path, stream)
+                else:
+                    with sftp.open(remote_path, 'rb') as remote_file:
+                        shutil.copyfileobj(remote_file, stream, FILE_CHUNK_SIZE)
+        except Exception:
+            stream.close()
+            raise
+        stream.seek(0)
+        return stream
+
+    def upload(self, local_path, remote_path, compressed=False):
+        with _open_local(local_path, compressed) as stream, SFTP_POOL.channel(*self.pool_args) as sftp:
+            if self.pipelined:
+                sftp.putfo(stream, remote_path)
+            else:
+                with sftp.open(remote_path, 'wb') as remote_file:
+                    shutil.copyfileobj(stream, remote_file, FILE_CHUNK_SIZE)
+
+    def rename(self, old_path, new_path):
+        with SFTP_POOL.channel(*self.pool_args) as sftp:
+            sftp.rename(old_path, new_path)
+
+
+class FTPDriver(object):
+    """Plain FTP transfers, one connection per operation."""
+
+    def __init__(self, host, port, username, password, timeout=60):
+        self.host = host
+        self.port = port or ftplib.FTP_PORT
+        self.username = username or ''
+        self.password = password or ''
+        self.timeout = timeout
+
+    @contextmanager
+    def _ftp(self):
+        ftp = ftplib.FTP(timeout=self.timeout)
+        try:
+            ftp.connect(self.host, self.port)
+            ftp.login(self.username, self.password)
+            yield ftp
+        finally:
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+
+    def connect(self):
+        with self._ftp():
+            pass
+
+    def close(self):
+        pass
+
+    def listdir(self, path):
+        entries = []
+        with self._ftp() as ftp:
+            for name, facts in ftp.mlsd(path, ['type', 'size', 'modify']):
+                if facts.get('type') != 'file':
+                    continue
+                modify = facts.get('modify')
+                mtime = modify and calendar.timegm(time.strptime(modify[:14], '%Y%m%d%H%M%S'))
+                entries.append(RemoteEntry(name, int(facts.get('size', 0)), mtime, None))
+        return entries
+
+    def download(self, remote_path):
+        stream = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            with self._ftp() as ftp:
+                ftp.retrbinary('RETR ' + remote_path, stream.write, FILE_CHUNK_SIZE)
+        except Exception:
+            stream.close()
+            raise
+        stream.seek(0)
+        return stream
+
+    def upload(self, local_path, remote_path, compressed=False):
+        with _open_local(local_path, compressed) as stream, self._ftp() as ftp:
+            ftp.storbinary('STOR ' + remote_path, stream, FILE_CHUNK_SIZE)
+
+    def rename(self, old_path, new_path):
+        with self._ftp() as ftp:
+            ftp.rename(old_path, new_path)
+
+
+class LocalDriver(object):
+    """Remote paths mapped onto a local directory, for staging and load tests."""
+
+    def __init__(self, root):
+        if not root:
+            raise ValueError('The local directory of the backend is not set.')
+        self.root = root
+
+    def _path(self, remote_path):
+        return os.path.join(self.root, remote_path.lstrip('/'))
+
+    def connect(self):
+        if not os.path.isdir(self.root):
+            raise FileNotFoundError(self.root)
+
+    def close(self):
+        pass
+
+    def listdir(self, path):
+        entries = []
+        for entry in os.scandir(self._path(path)):
+            stats = entry.stat()
+            entries.append(RemoteEntry(entry.name, stats.st_size, int(stats.st_mtime), stats.st_mode))
+        return entries
+
+    def download(self, remote_path):
+        return open(self._path(remote_path), 'rb')
+
+    def upload(self, local_path, remote_path, compressed=False):
+        path = self._path(remote_path)
+        # written aside then renamed, so that readers never see a partial file
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as tmp:
+            try:
+                with _open_local(local_path, compressed) as stream:
+                    shutil.copyfileobj(stream, tmp, FILE_CHUNK_SIZE)
+            except Exception:
+                os.unlink(tmp.name)
+                raise
+        os.replace(tmp.name, path)
+
+    def rename(self, old_path, new_path):
+        new_path = self._path(new_path)
+        os.makedirs(os.path.dirname(new_path), exist_ok=True)
+        os.rename(self._path(old_path), new_path)
+
@@ -0,0 +1,2 @@
+from . import test_benchmark
+from . import test_export_queries
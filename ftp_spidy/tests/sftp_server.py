@@ -0,0 +1,172 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface
+
+
+class StubServer(paramiko.ServerInterface):
+    """Accepts any password and only serves the sftp subsystem."""
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+
+class StubSFTPHandle(SFTPHandle):
+
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+
+class StubSFTPServer(SFTPServerInterface):
+    """SFTP operations mapped onto a local directory."""
+
+    def __init__(self, server, root, *args, **kwargs):
+        super(StubSFTPServer, self).__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _local_path(self, path):
+        return os.path.join(self.root, self.canonicalize(path).lstrip('/'))
+
+    def list_folder(self, path):
+        local_path = self._local_path(path)
+        try:
+            entries = []
+            for name in os.listdir(local_path):
+                attr = SFTPAttributes.from_stat(os.stat(os.path.join(local_path, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(self._local_path(path)))
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+    def lstat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.lstat(self._local_path(path)))
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+    def open(self, path, flags, attr):
+        try:
+            fd = os.open(self._local_path(path), flags | getattr(os, 'O_BINARY', 0), 0o666)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = StubSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._local_path(path))
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(self._local_path(oldpath), self._local_path(newpath))
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._local_path(path))
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        return paramiko.SFTP_OK
+
+
+class LocalSFTPServer(object):
+    """In-process SFTP server serving a temporary directory on localhost.
+
+    Stands in for the Spidy server in the benchmarks::
+
+        with LocalSFTPServer() as server:
+            server.makedirs('/RES/OUT')
+            backend.write({'host': server.host, 'port': server.port})
+    """
+
+    host = '127.0.0.1'
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp(prefix='spidy_sftp_')
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind((self.host, 0))
+        self.port = self.socket.getsockname()[1]
+        self._transports = []
+        self._thread = threading.Thread(target=self._serve, name='spidy-sftp-stub', daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        self.socket.listen(16)
+        self._thread.start()
+
+    def close(self):
+        self.socket.close()
+        for transport in self._transports:
+            transport.close()
+        self._thread.join(5)
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def clear(self):
+        for name in os.listdir(self.root):
+            shutil.rmtree(os.path.join(self.root, name))
+
+    def local_path(self, remote_path):
+        return os.path.join(self.root, remote_path.lstrip('/'))
+
+    def makedirs(self, remote_path):
+        os.makedirs(self.local_path(remote_path), exist_ok=True)
+
+    def _serve(self):
+        while True:
+            try:
+                client, dummy = self.socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', SFTPServer, StubSFTPServer, self.root)
+            self._transports.append(transport)
+            try:
+                transport.start_server(server=StubServer())
+            except (paramiko.SSHException, EOFError, OSError):
+                transport.close()
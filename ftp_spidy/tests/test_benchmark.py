@@ -0,0 +1,195 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+import csv
+import io
+import logging
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from odoo.tests.common import SavepointCase, tagged
+
+from .sftp_server import LocalSFTPServer
+
+_logger = logging.getLogger(__name__)
+
+# products, pickings and SHIP_IN orders of the data set
+SIZE = 1000
+# orders per SHIP_IN file put on the server for the import path
+ORDERS_PER_FILE = 250
+PARTNER_COUNT = 100
+MIB = 1024 * 1024
+# (queries, wall time in seconds, peak memory in bytes) allowed to each path on
+# SIZE pickings, with room for slower machines; lower them as the paths improve
+BUDGETS = {
+    'PRODUCT_OUT.action_make_file': (50, 10, 20 * MIB),
+    'SHIP_OUT.action_make_file': (50, 20, 50 * MIB),
+    'SHIP_OUT.action_done': (100, 30, 50 * MIB),
+    'SHIP_IN.parse_ship_in_attachment': (100 + 5 * SIZE, 60, 100 * MIB),
+    'SHIP_IN.action_receive_files': (200 + 5 * SIZE, 60, 100 * MIB),
+}
+
+
+@tagged('-standard', 'spidy_benchmark')
+class TestSpidyBenchmark(SavepointCase):
+    """Budgets of the Spidy export and import paths, run with ``--test-tags spidy_benchmark``.
+
+    The Spidy server is replaced by a local SFTP server. The paths are run
+    twice on the same data, rolled back in between: once timed, counting
+    the queries, and once tracing the memory, as tracemalloc slows them down.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestSpidyBenchmark, cls).setUpClass()
+        cls.server = LocalSFTPServer()
+        cls.server.start()
+        cls.server.makedirs('/RES/OUT')
+        cls.server.makedirs('/RES/IN/RES/CR_PRE')
+        cls.backend = cls.env['ftp.backend'].create({
+            'name': 'Spidy benchmark',
+            'protocol': 'sftp',
+            'host': cls.server.host,
+            'port': cls.server.port,
+            'username': 'benchmark',
+            'password': 'benchmark',
+        })
+        cls.products = cls.env['product.product'].create([{
+            'name': 'Benchmark product %06d' % index,
+            'default_code': 'BENCH%06d' % index,
+            'barcode': 'BENCH%06d' % index,
+            'type': 'product',
+            'weight': 1.5,
+            'list_price': 10.0,
+            'standard_price': 4.2,
+        } for index in range(SIZE)])
+        partners = cls.env['res.partner'].create([{
+            'name': 'Benchmark customer %d' % index,
+            'street': '%d rue de la Paix' % index,
+            'zip': '75002',
+            'city': 'Paris',
+            'country_id': cls.env.ref('base.fr').id,
+            'email': 'customer%d@example.com' % index,
+            'phone': '0100000000',
+        } for index in range(PARTNER_COUNT)])
+        sales = cls.env['sale.order'].create([{'partner_id': partners[index % PARTNER_COUNT].id}
+                                              for index in range(SIZE)])
+        # the SHIP_IN orders are matched on the sale of the procurement group
+        groups = cls.env['procurement.group'].create([{'name': sale.name, 'sale_id': sale.id} for sale in sales])
+        picking_type = cls.env.ref('stock.picking_type_out')
+        location = picking_type.default_location_src_id
+        location_dest = cls.env.ref('stock.stock_location_customers')
+        cls.pickings = cls.env['stock.picking'].create([{
+            'picking_type_id': picking_type.id,
+            'partner_id': sale.partner_id.id,
+            'group_id': group.id,
+            'location_id': location.id,
+            'location_dest_id': location_dest.id,
+            'move_lines': [(0, 0, {
+                'name': product.name,
+                'product_id': product.id,
+                'product_uom': product.uom_id.id,
+                'product_uom_qty': 1,
+                'location_id': location.id,
+                'location_dest_id': location_dest.id,
+            })],
+        } for sale, group, product in zip(sales, groups, cls.products)])
+        cls.order_names = sales.mapped('name')
+        cls.env['base'].flush()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.backend._get_transport().close()
+        cls.server.close()
+        super(TestSpidyBenchmark, cls).tearDownClass()
+
+    @contextmanager
+    def _measure(self, path, trace_memory):
+        result = self.results.setdefault(path, {})
+        if trace_memory:
+            tracemalloc.start()
+            try:
+                yield
+                self.env['base'].flush()
+                result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        else:
+            start, queries = time.perf_counter(), self.env.cr.sql_log_count
+            yield
+            self.env['base'].flush()
+            result['wall_time'] = round(time.perf_counter() - start, 3)
+            result['queries'] = self.env.cr.sql_log_count - queries
+
+    def _new_job(self, vals):
+        return self.env['ftp.job'].create(dict(vals, backend_id=self.backend.id))
+
+    def _ship_in_file(self, order_names):
+        content = io.StringIO()
+        writer = csv.writer(content, delimiter=';')
+        for index, name in enumerate(order_names):
+            writer.writerow(['ENT', 'ASF', 'LVD', name])
+            writer.writerow(['COL', '', '', '', '', '', '', '', 'TRACK%08d' % index])
+        return content.getvalue().encode('iso-8859-1')
+
+    def _run_paths(self, trace_memory):
+        job = self._new_job({'ftp_type': 'PRODUCT_OUT', 'state': 'progress',
+                             'product_ids': [(6, 0, self.products.ids)]})
+        with self._measure('PRODUCT_OUT.action_make_file', trace_memory):
+            job.action_make_file()
+
+        job = self._new_job({'ftp_type': 'SHIP_OUT', 'state': 'progress'})
+        self.env['ftp.event'].create([{'picking_id': picking.id, 'ftp_type': 'SHIP_OUT', 'job_id': job.id}
+                                      for picking in self.pickings])
+        with self._measure('SHIP_OUT.action_make_file', trace_memory):
+            job.action_make_file()
+        with self._measure('SHIP_OUT.action_done', trace_memory):
+            job.action_done()
+
+        job = self._new_job({'ftp_type': 'SHIP_IN', 'name': 'CR_PRE_benchmark.csv', 'state': 'draft'})
+        with tempfile.TemporaryFile() as stream:
+            stream.write(self._ship_in_file(self.order_names))
+            stream.seek(0)
+            job._create_file_attachment(job.name, stream)
+        with self._measure('SHIP_IN.parse_ship_in_attachment', trace_memory):
+            job.parse_ship_in_attachment()
+        self.assertEqual(len(job.event_ids), SIZE, "Each SHIP_IN order should match its picking")
+
+        self.server.clear()
+        self.server.makedirs('/RES/OUT')
+        self.server.makedirs('/RES/IN/RES/CR_PRE')
+        for index in range(0, SIZE, ORDERS_PER_FILE):
+            path = self.server.local_path('/RES/IN/RES/CR_PRE/CR_PRE_%06d.csv' % index)
+            with open(path, 'wb') as remote_file:
+                remote_file.write(self._ship_in_file(self.order_names[index:index + ORDERS_PER_FILE]))
+        # the backend of the receiving job is the one the files are fetched from
+        anchor = self._new_job({'ftp_type': 'SHIP_IN', 'name': 'anchor', 'state': 'done'})
+        with self._measure('SHIP_IN.action_receive_files', trace_memory):
+            anchor.action_receive_files(False, 'SHIP_IN')
+        received = self.env['ftp.event'].search_count([('job_id.backend_id', '=', self.backend.id),
+                                                       ('job_id', 'not in', (job + anchor).ids),
+                                                       ('ftp_type', '=', 'SHIP_IN')])
+        self.assertEqual(received, SIZE, "Each received SHIP_IN order should match its picking")
+
+    def test_budgets(self):
+        self.results = {}
+        for trace_memory in (False, True):
+            self.env.cr.execute('SAVEPOINT spidy_benchmark_paths')
+            try:
+                self._run_paths(trace_memory)
+            finally:
+                self.env.clear()
+                self.env.cr.execute('ROLLBACK TO SAVEPOINT spidy_benchmark_paths')
+        _logger.info('Spidy benchmark on %d pickings:\n%s', SIZE, '\n'.join(
+            '%-35s %8.3fs %8.1f MiB %6d queries' % (path, values['wall_time'], values['peak_memory'] / MIB,
+                                                     values['queries'])
+            for path, values in sorted(self.results.items())
+        ))
+        for path, (queries, wall_time, peak_memory) in BUDGETS.items():
+            with self.subTest(path=path):
+                values = self.results[path]
+                self.assertLessEqual(values['queries'], queries)
+                self.assertLessEqual(values['wall_time'], wall_time)
+                self.assertLessEqual(values['peak_memory'], peak_memory)
@@ -0,0 +1,86 @@
+# Copyright 2021 Romain Deheele
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+
+from odoo.tests.common import SavepointCase
+
+
+class TestExportQueries(SavepointCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestExportQueries, cls).setUpClass()
+        cls.country = cls.env.ref('base.fr')
+        cls.products = cls.env['product.product'].create([{
+            'name': 'Spidy product %d' % index,
+            'default_code': 'SPIDY%d' % index,
+            'type': 'product',
+            'standard_price': 4.2,
+        } for index in range(2)])
+
+    def _create_job(self, ftp_type, size):
+        """Create a job of ``size`` events, each on its own customer and picking of two lines."""
+        if ftp_type == 'SHIP_OUT':
+            picking_type = self.env.ref('stock.picking_type_out')
+            location_dest = self.env.ref('stock.stock_location_customers')
+        else:
+            picking_type = self.env.ref('stock.picking_type_in')
+            location_dest = self.env.ref('stock.stock_location_stock')
+        location = picking_type.default_location_src_id or self.env.ref('stock.stock_location_suppliers')
+        job = self.env['ftp.job'].create({'ftp_type': ftp_type, 'state': 'progress'})
+        events = []
+        for index in range(size):
+            company = self.env['res.partner'].create({
+                'name': 'Spidy company %d' % index,
+                'is_company': True,
+                'email': 'company%d@example.com' % index,
+            })
+            customer = self.env['res.partner'].create({
+                'name': 'Spidy customer %d' % index,
+                'parent_id': company.id,
+                'street': '%d rue de la Paix' % index,
+                'zip': '75002',
+                'city': 'Paris',
+                'country_id': self.country.id,
+            })
+            sale = self.env['sale.order'].create({'partner_id': customer.id})
+            group = self.env['procurement.group'].create({'name': sale.name, 'sale_id': sale.id})
+            picking = self.env['stock.picking'].create({
+                'picking_type_id': picking_type.id,
+                'partner_id': customer.id,
+                'group_id': group.id,
+                'location_id': location.id,
+                'location_dest_id': location_dest.id,
+                'move_lines': [(0, 0, {
+                    'name': product.name,
+                    'product_id': product.id,
+                    'product_uom': product.uom_id.id,
+                    'product_uom_qty': 1,
+                    'location_id': location.id,
+                    'location_dest_id': location_dest.id,
+                }) for product in self.products],
+            })
+            events.append({'picking_id': picking.id, 'ftp_type': ftp_type, 'job_id': job.id})
+        self.env['ftp.event'].create(events)
+        return job
+
+    def _count_queries(self, job):
+        """Return the queries run to build the rows of the job file, and the rows."""
+        job.flush()
+        job.invalidate_cache()
+        queries = self.env.cr.sql_log_count
+        rows = list(job._prepare_datas())
+        return self.env.cr.sql_log_count - queries, rows
+
+    def _assert_constant_queries(self, ftp_type):
+        few_queries, few_rows = self._count_queries(self._create_job(ftp_type, 2))
+        many_queries, many_rows = self._count_queries(self._create_job(ftp_type, 20))
+        # the header, then one row per picking line
+        self.assertEqual(len(few_rows), 1 + 2 * len(self.products))
+        self.assertEqual(len(many_rows), 1 + 20 * len(self.products))
+        self.assertEqual(few_queries, many_queries)
+
+    def test_ship_out_queries(self):
+        self._assert_constant_queries('SHIP_OUT')
+
+    def test_rec_out_queries(self):
+        self._assert_constant_queries('REC_OUT')
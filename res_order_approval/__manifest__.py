@@ -14,11 +14,13 @@
 
     'category': 'sale',
 
-    'depends': ['base', 'sale'],
+    'depends': ['base', 'sale', 'sale_order_type'],
 
     # always loaded
     'data': [
+        'security/ir.model.access.csv',
         'views/sale_views.xml',
+        'views/sale_order_approval_rule_views.xml',
     ],
     'installable': True,
     'application': True,
@@ -1,3 +1,4 @@
 # -*- coding: utf-8 -*-
 
-from . import sale_order
\ No newline at end of file
+from . import sale_order
+from . import sale_order_approval_rule
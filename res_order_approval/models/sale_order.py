@@ -7,16 +7,23 @@ class SaleOrder(models.Model):
     _inherit = 'sale.order'
 
     def submit_for_approval(self):
-        for rec in self:
-            rec.state = 'waiting_for_approval'
+        self.write({'state': 'waiting_for_approval'})
+
+    def _filter_needs_approval(self):
+        orders = self.filtered(lambda order: order.state in ('draft', 'sent'))
+        needs_approval = orders.filtered(lambda order: order.state == 'sent' and order.require_signature)
+        for rule in self.env['sale.order.approval.rule'].search([]):
+            needs_approval |= rule._filter_orders(orders - needs_approval)
+        return needs_approval
 
     def action_confirm(self):
-        for rec in self:
-            print(rec.state)
-            if rec.state == 'sent' and rec.require_signature:
-                return rec.submit_for_approval()
-            else:
-                return super(SaleOrder, rec).action_confirm()
+        to_approve = self._filter_needs_approval()
+        if to_approve:
+            to_approve.submit_for_approval()
+        to_confirm = self - to_approve
+        if to_confirm:
+            return super(SaleOrder, to_confirm).action_confirm()
+        return True
 
     state = fields.Selection([
         ('draft', 'Quotation'),
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import ValidationError
+
+
+class SaleOrderApprovalRule(models.Model):
+    _name = 'sale.order.approval.rule'
+    _description = 'Sale Order Approval Rule'
+    _order = 'sequence, id'
+
+    name = fields.Char(required=True)
+    sequence = fields.Integer(default=10)
+    active = fields.Boolean(default=True)
+    company_id = fields.Many2one('res.company', 'Company')
+    amount_min = fields.Float('Minimum Total',
+                              help="Orders whose total, in their own currency, reaches this amount need an approval.")
+    partner_ids = fields.Many2many('res.partner', string='Customers',
+                                   help="Orders of these customers, or of their contacts, need an approval.")
+    type_ids = fields.Many2many('sale.order.type', string='Types',
+                                help="Orders of these types need an approval.")
+
+    @api.constrains('name', 'amount_min', 'partner_ids', 'type_ids')
+    def _check_criteria(self):
+        for rule in self:
+            if not (rule.amount_min or rule.partner_ids or rule.type_ids):
+                raise ValidationError(_("The approval rule %s must set a minimum total, customers or types, "
+                                        "otherwise every order would need an approval.") % rule.name)
+
+    def _filter_orders(self, orders):
+        """Return the orders matching all the criteria set on the rule."""
+        self.ensure_one()
+        if self.company_id:
+            orders = orders.filtered(lambda order: order.company_id == self.company_id)
+        if self.amount_min:
+            orders = orders.filtered(lambda order: order.amount_total >= self.amount_min)
+        if self.partner_ids:
+            orders = orders.filtered(lambda order: order.partner_id.commercial_partner_id in self.partner_ids
+                                     or order.partner_id in self.partner_ids)
+        if self.type_ids:
+            orders = orders.filtered(lambda order: order.type_id in self.type_ids)
+        return orders
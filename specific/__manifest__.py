@@ -2,11 +2,12 @@
 
 {
     "name": "Specific",
-    "version": "13.0.1.0.0",
+    "version": "13.0.1.1.0",
     "license": "AGPL-3",
     "depends": ["sale_order_type", "sale_automatic_workflow",
                 "connector_prestashop"],
-    "data": ['views/sale_order_type_view.xml',
+    "data": ['security/ir.model.access.csv',
+             'views/sale_order_type_view.xml',
              'views/product_view.xml'],
     "installable": True,
 }
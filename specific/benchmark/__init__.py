@@ -0,0 +1,17 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+"""Benchmark of the static mappings of the PrestaShop mappers.
+
+It is not loaded with the module. Run it from a shell on a database where
+specific is installed::
+
+    $ odoo-bin shell -c odoo.conf -d presta_bench --no-http <<EOF
+    from odoo.addons.specific.benchmark import run_mapper_benchmark
+    run_mapper_benchmark(env, size=100000)
+    EOF
+
+Synthetic PrestaShop customers are mapped by two throwaway mappers, one
+declaring the constants of the module as ``@mapping`` methods, as before,
+and one declaring them as ``_static_values``.
+"""
+
+from .mapper import run_mapper_benchmark
@@ -0,0 +1,114 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+import logging
+import time
+
+from odoo.addons.component.core import Component, ComponentRegistry, WorkContext
+from odoo.addons.connector.components.mapper import mapping
+
+from ..models.res_partner import PartnerImportMapper
+from ..models.sale import SaleOrderImportMapper
+
+_logger = logging.getLogger(__name__)
+
+# the mappings of the benchmark mappers which are not constants
+DIRECT = [
+    ("email", "email"),
+    ("website", "website"),
+    ("note", "comment"),
+]
+
+
+class MethodMapper(Component):
+    _register = False
+    _name = "specific.benchmark.method.mapper"
+    _inherit = "base.import.mapper"
+
+    direct = DIRECT
+
+    @mapping
+    def studio1(self, record):
+        return {"x_studio_statut_rsilience": "Envoyé à l’entrepôt"}
+
+    @mapping
+    def studio2(self, record):
+        return {"x_studio_type_de_livraison": "Log'ins"}
+
+    @mapping
+    def team(self, record):
+        return {"team_id": 2}
+
+    @mapping
+    def studio3(self, record):
+        return {"x_studio_typologie_du_contact": "Client B2C"}
+
+
+class StaticValuesMapper(Component):
+    _register = False
+    _name = "specific.benchmark.static.mapper"
+    _inherit = "base.import.mapper"
+
+    direct = DIRECT
+    _static_values = dict(
+        SaleOrderImportMapper._static_values, **PartnerImportMapper._static_values
+    )
+
+
+def _payloads(size):
+    return [
+        {
+            "id": str(index),
+            "email": "customer%d@example.com" % index,
+            "website": "https://customer%d.example.com" % index,
+            "note": "Synthetic customer %d" % index,
+        }
+        for index in range(size)
+    ]
+
+
+def _throughput(mapper, payloads, repeat):
+    best = None
+    for dummy in range(repeat):
+        start = time.perf_counter()
+        for payload in payloads:
+            mapper.map_record(payload).values(for_create=True)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return len(payloads) / best
+
+
+def run_mapper_benchmark(env, size=10000, repeat=3):
+    """Map ``size`` synthetic customers with both mappers.
+
+    Returns the records mapped per second, best of ``repeat`` runs, by
+    mapper and the speedup of the static mappings.
+    """
+    registry = ComponentRegistry()
+    env["component.builder"].build_registry(registry, states=("installed",))
+    MethodMapper._build_component(registry)
+    StaticValuesMapper._build_component(registry)
+    registry.ready = True
+    work = WorkContext(
+        model_name="res.partner",
+        collection=env["prestashop.backend"],
+        components_registry=registry,
+    )
+    payloads = _payloads(size)
+    method_mapper = work.component_by_name(MethodMapper._name)
+    static_mapper = work.component_by_name(StaticValuesMapper._name)
+    if method_mapper.map_record(payloads[0]).values(for_create=True) != static_mapper.map_record(
+        payloads[0]
+    ).values(for_create=True):
+        raise AssertionError("The benchmark mappers do not map the same values.")
+    results = {
+        "mapping_methods": _throughput(method_mapper, payloads, repeat),
+        "static_values": _throughput(static_mapper, payloads, repeat),
+    }
+    results["speedup"] = results["static_values"] / results["mapping_methods"]
+    _logger.info(
+        "%d records mapped per second with @mapping methods, %d with static values (x%.2f)",
+        results["mapping_methods"],
+        results["static_values"],
+        results["speedup"],
+    )
+    return results
@@ -0,0 +1,41 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo.addons.component.core import AbstractComponent
+from odoo.addons.connector.components.mapper import MappingDefinition
+
+# like a @mapping without changed_by: skipped when the mapping is restricted to some fields
+STATIC_DEFINITION = MappingDefinition(changed_by=set(), only_create=False)
+
+
+class StaticMapper(AbstractComponent):
+    """Constant mappings, applied with one merge per record.
+
+    ``_static_values`` are set on every record. They are collected along the
+    inheritance of a mapper the first time it is used and returned by a
+    single mapping, instead of being a ``@mapping`` method called per record
+    each. Like the other mappings, they are in the values when ``finalize``
+    runs.
+    """
+
+    _inherit = "base.mapper"
+
+    _static_values = {}
+
+    @classmethod
+    def _get_static_values(cls):
+        static_values = cls.__dict__.get("_static_values_cache")
+        if static_values is None:
+            static_values = {}
+            for base in reversed(cls.__mro__):
+                static_values.update(base.__dict__.get("_static_values", {}))
+            cls._static_values_cache = static_values
+        return static_values
+
+    def _static_mapping(self, record):
+        return self._get_static_values()
+
+    @property
+    def map_methods(self):
+        yield from super(StaticMapper, self).map_methods
+        if self._get_static_values():
+            yield self._static_mapping, STATIC_DEFINITION
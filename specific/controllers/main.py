@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import logging
+from odoo.http import request
 from odoo.addons.website_sale.controllers.main import WebsiteSale
 
 
@@ -7,7 +8,9 @@ class WebsiteSaleSpe(WebsiteSale):
 
     def _checkout_form_save(self, mode, checkout, all_values):
         if mode[0] == 'new':
-            checkout.update({'sale_type': 5})
+            web_type = request.env['sale.order.type'].sudo().search([('is_web_type', '=', True)], limit=1)
+            if web_type:
+                checkout.update({'sale_type': web_type.id})
         partner_id = super(WebsiteSaleSpe, self)._checkout_form_save(mode,
                                                                      checkout,
                                                                      all_values)
@@ -0,0 +1,6 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+
+def migrate(cr, version):
+    # the web shop type used to be recognized by its id
+    cr.execute("UPDATE sale_order_type SET is_web_type = TRUE WHERE id = 5")
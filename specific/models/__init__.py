@@ -1,5 +1,6 @@
 from . import sale
 from . import sale_order_type
 from . import res_partner
+from . import ir_sequence
 from . import product_template
 from . import prestashop_backend
@@ -0,0 +1,31 @@
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
+
+from odoo import models
+
+
+class IrSequence(models.Model):
+    _inherit = "ir.sequence"
+
+    def _next_block(self, count):
+        """Return the ``count`` next values of the sequence, reserved in one query."""
+        self.ensure_one()
+        self.check_access_rights("read")
+        if self.use_date_range or count < 2:
+            return [self._next() for dummy in range(count)]
+        if self.implementation == "standard":
+            self.env.cr.execute(
+                "SELECT nextval(%s) FROM generate_series(1, %s)",
+                ("ir_sequence_%03d" % self.id, count),
+            )
+            numbers = [row[0] for row in self.env.cr.fetchall()]
+        else:
+            self.flush(["number_next", "number_increment"])
+            self.env.cr.execute(
+                "UPDATE ir_sequence SET number_next = number_next + %s WHERE id = %s "
+                "RETURNING number_next - %s",
+                (self.number_increment * count, self.id, self.number_increment * count),
+            )
+            number_next = self.env.cr.fetchone()[0]
+            self.invalidate_cache(["number_next"], [self.id])
+            numbers = [number_next + self.number_increment * index for index in range(count)]
+        return [self.get_next_char(number) for number in numbers]
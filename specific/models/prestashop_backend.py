@@ -1,68 +1,244 @@
-from odoo import models
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import fields, models
+from odoo.tools import split_every
+from odoo.addons.component.core import AbstractComponent
+
+_logger = logging.getLogger(__name__)
+
+# records fetched per webservice call
+BOOTSTRAP_PAGE_SIZE = 500
+BOOTSTRAP_WORKERS = 4
+
+# reference data imports: how each model is imported and the imports it needs first
+BOOTSTRAP_STEPS = {
+    'prestashop.shop.group': ('batch', ()),
+    'prestashop.shop': ('batch', ('prestashop.shop.group',)),
+    'prestashop.res.lang': ('matching', ()),
+    'prestashop.res.country': ('matching', ()),
+    'prestashop.res.currency': ('matching', ()),
+    'prestashop.account.tax': ('matching', ()),
+    'prestashop.account.tax.group': ('batch', ('prestashop.account.tax', 'prestashop.res.country')),
+    'prestashop.sale.order.state': ('batch', ('prestashop.res.lang',)),
+}
+
+# (records fetched in bulk, ids unchanged since the last bootstrap) of the
+# running bootstrap, by backend and resource
+_prefetched = threading.local()
+
+
+def _content_hash(record):
+    return hashlib.sha1(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _bootstrap_order(model_names):
+    """Sort the models so that each one comes after the imports it needs."""
+    ordered, visiting = [], set()
+
+    def visit(model_name):
+        if model_name in ordered:
+            return
+        if model_name in visiting:
+            raise ValueError('Circular bootstrap dependency on %s' % model_name)
+        visiting.add(model_name)
+        for dependency in BOOTSTRAP_STEPS[model_name][1]:
+            if dependency in model_names:
+                visit(dependency)
+        ordered.append(model_name)
+
+    for model_name in sorted(model_names):
+        visit(model_name)
+    return ordered
+
+
+def _fetch_resource(client, resource, page_size=BOOTSTRAP_PAGE_SIZE):
+    """Return ``({id: record}, duration)`` for a whole webservice resource.
+
+    Runs in a worker thread: it must not touch the environment.
+    """
+    start = time.perf_counter()
+    records, offset = {}, 0
+    while True:
+        res = client.get(resource, options={'display': 'full', 'limit': '%d,%d' % (offset, page_size)})
+        # {'taxes': {'tax': [...]}}, with a dict instead of the list for a single
+        # record and an empty string when there is none
+        page = res and list(res.values())[0]
+        page = page and list(page.values())[0] or []
+        if isinstance(page, dict):
+            page = [page]
+        for record in page:
+            records[int(record['id'])] = record
+        if len(page) < page_size:
+            return records, time.perf_counter() - start
+        offset += page_size
+
+
+class PrestashopAdapter(AbstractComponent):
+    _inherit = 'prestashop.adapter'
+
+    def _prefetched_records(self):
+        backends = getattr(_prefetched, 'backends', {})
+        return backends.get(self.backend_record.id, {}).get(self._prestashop_model, (None, ()))
+
+    def search(self, filters=None):
+        records, unchanged = self._prefetched_records()
+        if records is not None and not filters:
+            return [prestashop_id for prestashop_id in records if prestashop_id not in unchanged]
+        # filtered searches may be paginated, their callers stop on a short page
+        return super(PrestashopAdapter, self).search(filters)
+
+    def read(self, id, attributes=None):
+        records, unchanged = self._prefetched_records()
+        if records is not None and not attributes and int(id) in records:
+            return records[int(id)]
+        return super(PrestashopAdapter, self).read(id, attributes=attributes)
+
+
+class PrestashopResponseCache(models.Model):
+    _name = 'prestashop.response.cache'
+    _description = 'PrestaShop Response Cache'
+
+    backend_id = fields.Many2one('prestashop.backend', 'Backend', required=True, ondelete='cascade')
+    resource = fields.Char(required=True)
+    prestashop_id = fields.Integer('PrestaShop ID', required=True)
+    content_hash = fields.Char(required=True)
+
+    _sql_constraints = [
+        ('resource_uniq', 'unique(backend_id, resource, prestashop_id)',
+         'A PrestaShop record can only be cached once per backend.'),
+    ]
+
+    def _unchanged_ids(self, backend, resource, hashes):
+        """Return the ids of ``{prestashop id: hash}`` already imported with the same content."""
+        self.env.cr.execute("""
+            SELECT prestashop_id, content_hash FROM prestashop_response_cache
+            WHERE backend_id = %s AND resource = %s
+        """, (backend.id, resource))
+        return {prestashop_id for prestashop_id, content_hash in self.env.cr.fetchall()
+                if hashes.get(prestashop_id) == content_hash}
+
+    def _store(self, backend, resource, hashes):
+        for chunk in split_every(1000, hashes.items()):
+            values = ','.join(
+                self.env.cr.mogrify('(%s, %s, %s, %s)', (backend.id, resource, prestashop_id, content_hash)).decode()
+                for prestashop_id, content_hash in chunk
+            )
+            self.env.cr.execute("""
+                INSERT INTO prestashop_response_cache
+                    (backend_id, resource, prestashop_id, content_hash, create_date, write_date)
+                SELECT v.*, now() at time zone 'UTC', now() at time zone 'UTC'
+                FROM (VALUES %s) AS v
+                ON CONFLICT (backend_id, resource, prestashop_id)
+                DO UPDATE SET content_hash = EXCLUDED.content_hash, write_date = EXCLUDED.write_date
+            """ % values)
+
 
 class PrestashopBackend(models.Model):
     _inherit = 'prestashop.backend'
 
-    def synchronize_shop_group(self):
+    def _bootstrap(self, model_names, force=False):
+        """Import the given reference data of the backends.
+
+        Each resource is fetched with paginated ``display=full`` calls, all
+        the resources at once in a thread pool, and the importers are then
+        run in dependency order on the current cursor, reading the fetched
+        records instead of querying them one by one.
+
+        Records whose content did not change since they were last imported
+        or matched are hidden from the unfiltered searches of the importers,
+        which are not run at all when nothing changed, unless ``force`` is
+        set.
+
+        Returns ``{backend id: {model: {'records', 'changed', 'fetch', 'import'}}}``.
+        """
+        cache = self.env['prestashop.response.cache'].sudo()
+        ordered = _bootstrap_order(model_names)
+        timings = {}
         for backend in self:
-            for model_name in [
-                'prestashop.shop.group',
-            ]:
-                # import directly, do not delay because this
-                # is a fast operation, a direct return is fine
-                # and it is simpler to import them sequentially
-                self.env[model_name].import_batch(backend)
+            backend_timings = timings[backend.id] = {}
+            futures = {}
+            with ThreadPoolExecutor(max_workers=BOOTSTRAP_WORKERS) as executor:
+                for model_name in ordered:
+                    with backend.work_on(model_name) as work:
+                        adapter = work.component(usage='backend.adapter')
+                        futures[model_name] = (adapter._prestashop_model,
+                                               executor.submit(_fetch_resource, adapter.client,
+                                                               adapter._prestashop_model))
+                # the imports start as soon as their own resource is there
+                resources = {}
+                _prefetched.backends = {backend.id: resources}
+                try:
+                    for model_name in ordered:
+                        resource, future = futures[model_name]
+                        records, fetch_duration = future.result()
+                        hashes = {prestashop_id: _content_hash(record) for prestashop_id, record in records.items()}
+                        unchanged = set() if force else cache._unchanged_ids(backend, resource, hashes)
+                        resources[resource] = (records, unchanged)
+                        start = time.perf_counter()
+                        if len(unchanged) < len(records):
+                            if BOOTSTRAP_STEPS[model_name][0] == 'batch':
+                                self.env[model_name].import_batch(backend)
+                            else:
+                                with backend.work_on(model_name) as work:
+                                    work.component(usage='auto.matching.importer').run()
+                            # records which were neither imported nor matched are tried again next time
+                            bound_ids = set(self.env[model_name].with_context(active_test=False).search([
+                                ('backend_id', '=', backend.id),
+                                ('prestashop_id', 'in', [prestashop_id for prestashop_id in hashes
+                                                         if prestashop_id not in unchanged]),
+                            ]).mapped('prestashop_id'))
+                            cache._store(backend, resource, {prestashop_id: hashes[prestashop_id]
+                                                             for prestashop_id in bound_ids})
+                        backend_timings[model_name] = {
+                            'records': len(records),
+                            'changed': len(records) - len(unchanged),
+                            'fetch': round(fetch_duration, 3),
+                            'import': round(time.perf_counter() - start, 3),
+                        }
+                finally:
+                    _prefetched.backends = {}
+            _logger.info('PrestaShop backend %s bootstrapped:\n%s', backend.name, '\n'.join(
+                '%-35s %6d records, %6d changed, fetched in %.3fs, imported in %.3fs'
+                % (model_name, values['records'], values['changed'], values['fetch'], values['import'])
+                for model_name, values in backend_timings.items()
+            ))
+        return timings
+
+    def synchronize_reference_data(self):
+        self._bootstrap(list(BOOTSTRAP_STEPS))
+        return True
+
+    def clear_response_cache(self):
+        """Have the next synchronizations import every record again."""
+        self.env['prestashop.response.cache'].sudo().search([('backend_id', 'in', self.ids)]).unlink()
+        return True
+
+    def synchronize_shop_group(self):
+        self._bootstrap(['prestashop.shop.group'])
         return True
 
     def synchronize_shop(self):
-        for backend in self:
-            for model_name in [
-                'prestashop.shop'
-            ]:
-                # import directly, do not delay because this
-                # is a fast operation, a direct return is fine
-                # and it is simpler to import them sequentially
-                self.env[model_name].import_batch(backend)
+        self._bootstrap(['prestashop.shop'])
         return True
 
     def synchronize_res_lang(self):
-        for backend in self:
-            for model_name in [
-                'prestashop.res.lang',
-            ]:
-                with backend.work_on(model_name) as work:
-                    importer = work.component(usage='auto.matching.importer')
-                    importer.run()
+        self._bootstrap(['prestashop.res.lang'])
         return True
 
     def synchronize_res_country(self):
-        for backend in self:
-            for model_name in [
-                'prestashop.res.country',
-            ]:
-                with backend.work_on(model_name) as work:
-                    importer = work.component(usage='auto.matching.importer')
-                    importer.run()
+        self._bootstrap(['prestashop.res.country'])
         return True
 
     def synchronize_res_currency(self):
-        for backend in self:
-            for model_name in [
-                'prestashop.res.currency',
-            ]:
-                with backend.work_on(model_name) as work:
-                    importer = work.component(usage='auto.matching.importer')
-                    importer.run()
+        self._bootstrap(['prestashop.res.currency'])
         return True
 
     def synchronize_account_tax(self):
-        for backend in self:
-            for model_name in [
-                'prestashop.account.tax',
-            ]:
-                with backend.work_on(model_name) as work:
-                    importer = work.component(usage='auto.matching.importer')
-                    importer.run()
-            self.env['prestashop.account.tax.group'].import_batch(backend)
-            self.env['prestashop.sale.order.state'].import_batch(backend)
+        self._bootstrap(['prestashop.account.tax', 'prestashop.account.tax.group',
+                         'prestashop.sale.order.state'])
         return True
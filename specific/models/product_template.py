@@ -1,6 +1,8 @@
-from odoo import models, fields
+import hashlib
+
+from odoo import api, models, fields
 from odoo.addons.component.core import Component
-from odoo.addons.connector.components.mapper import mapping
+from odoo.addons.connector.components.mapper import changed_by, mapping
 
 
 class PrestashopProductTemplate(models.Model):
@@ -19,14 +21,54 @@ class PrestashopProductTemplate(models.Model):
     )
 
 
+class PrestashopProductTemplateHtmlHash(models.Model):
+    _name = 'prestashop.product.template.html.hash'
+    _description = 'Exported PrestaShop Product HTML'
+
+    binding_id = fields.Many2one('prestashop.product.template', 'Binding', required=True, ondelete='cascade')
+    lang = fields.Char('Language', required=True)
+    field_name = fields.Char(required=True)
+    content_hash = fields.Char(required=True)
+
+    _sql_constraints = [
+        ('field_uniq', 'unique(binding_id, lang, field_name)',
+         'An HTML field can only be hashed once per binding and language.'),
+    ]
+
+    @api.model
+    def _changed_values(self, binding, field_names):
+        """Return the values of ``field_names`` of ``binding`` which differ from
+        the ones last exported in the current language, and remember them.
+        """
+        lang = binding.env.context.get('lang') or 'en_US'
+        hashes = {html_hash.field_name: html_hash for html_hash in self.search([
+            ('binding_id', '=', binding.id),
+            ('lang', '=', lang),
+            ('field_name', 'in', field_names),
+        ])}
+        values = {}
+        for field_name in field_names:
+            value = binding[field_name]
+            content_hash = hashlib.sha1((value or '').encode('utf-8')).hexdigest()
+            html_hash = hashes.get(field_name)
+            if not html_hash:
+                self.create({'binding_id': binding.id, 'lang': lang,
+                             'field_name': field_name, 'content_hash': content_hash})
+            elif html_hash.content_hash != content_hash:
+                html_hash.content_hash = content_hash
+            elif binding.prestashop_id:
+                continue
+            values[field_name] = value
+        return values
+
+
 class ProductTemplateExportMapper(Component):
     _inherit = 'prestashop.product.template.export.mapper'
 
-    @mapping
-    def sizeguide(self, record):
-        return {'sizeguide': record.sizeguide}
+    _html_fields = ['sizeguide', 'transparency']
 
+    @changed_by('sizeguide', 'transparency')
     @mapping
-    def transparency(self, record):
-        return {'transparency': record.transparency}
-
+    def html_fields(self, record):
+        # the largest fields of the products: only sent when they changed
+        return self.env['prestashop.product.template.html.hash'].sudo()._changed_values(record, self._html_fields)
@@ -1,27 +1,33 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+from collections import defaultdict
+
 from odoo import fields, models, api
 from odoo.addons.component.core import Component
-from odoo.addons.connector.components.mapper import mapping
 
 
 class ResPartner(models.Model):
     _inherit = "res.partner"
 
-    @api.model
-    def create(self, vals):
-        if vals.get("sale_type"):
-            sale_type = self.env["sale.order.type"].browse(vals["sale_type"])
+    @api.model_create_multi
+    def create(self, vals_list):
+        vals_by_type = defaultdict(list)
+        for vals in vals_list:
+            if vals.get("sale_type"):
+                vals_by_type[vals["sale_type"]].append(vals)
+        for sale_type in self.env["sale.order.type"].browse(list(vals_by_type)):
+            type_vals_list = vals_by_type[sale_type.id]
             if sale_type.partner_sequence_id:
-                vals["ref"] = sale_type.partner_sequence_id.next_by_id()
-            if sale_type.id == 5:
-                vals['x_studio_typologie_du_contact'] = 'Client Web Odoo'
-        return super(ResPartner, self).create(vals)
+                refs = sale_type.partner_sequence_id._next_block(len(type_vals_list))
+                for vals, ref in zip(type_vals_list, refs):
+                    vals["ref"] = ref
+            if sale_type.is_web_type:
+                for vals in type_vals_list:
+                    vals["x_studio_typologie_du_contact"] = "Client Web Odoo"
+        return super(ResPartner, self).create(vals_list)
 
 
 class PartnerImportMapper(Component):
     _inherit = 'prestashop.res.partner.mapper'
 
-    @mapping
-    def studio3(self, record):
-        return {'x_studio_typologie_du_contact': "Client B2C"}
+    _static_values = {'x_studio_typologie_du_contact': "Client B2C"}
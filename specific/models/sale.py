@@ -1,7 +1,6 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 from odoo import api, fields, models
 from odoo.addons.component.core import Component
-from odoo.addons.connector.components.mapper import mapping
 
 
 class SaleOrder(models.Model):
@@ -9,23 +8,32 @@ class SaleOrder(models.Model):
 
     @api.depends("partner_id", "company_id")
     def _compute_sale_type_id(self):
+        SaleType = self.env["sale.order.type"]
+        default_type = SaleType.browse(SaleType._get_default_type_id())
+        # the partner type is company dependent: read once per company
+        orders_by_company = {}
+        for record in self.filtered("partner_id"):
+            orders_by_company.setdefault(record.company_id, []).append(record)
+        sale_types = {}
+        for company, orders in orders_by_company.items():
+            partners = self.env["res.partner"].browse(
+                {order.partner_id.id for order in orders}
+                | {order.partner_id.commercial_partner_id.id for order in orders}
+            )
+            for vals in partners.with_context(force_company=company.id).read(["sale_type"], load=None):
+                sale_types[company.id, vals["id"]] = vals["sale_type"]
         for record in self:
             if not record.partner_id:
-                record.type_id = self.env["sale.order.type"].search(
-                    [('name', '=', 'B2B Odoo')], order='id desc', limit=1
-                )
+                record.type_id = default_type
             else:
-                sale_type = (
-                    record.partner_id.with_context(
-                        force_company=record.company_id.id
-                    ).sale_type
-                    or record.partner_id.commercial_partner_id.with_context(
-                        force_company=record.company_id.id
-                    ).sale_type
+                company_id = record.company_id.id
+                sale_type = SaleType.browse(
+                    sale_types[company_id, record.partner_id.id]
+                    or sale_types[company_id, record.partner_id.commercial_partner_id.id]
                 )
                 if sale_type:
                     record.type_id = sale_type
-                if sale_type.id == 5:
+                if sale_type.is_web_type:
                     record.x_studio_type_de_livraison = "Log'ins"
                     record.x_studio_statut_rsilience = "Envoyé à l’entrepôt"
 
@@ -36,7 +44,7 @@ class SaleOrder(models.Model):
             order_type = order.type_id
             if order_type.workflow_process_id:
                 order.update({'workflow_process_id': order_type.workflow_process_id})
-            if order_type.id == 5:
+            if order_type.is_web_type:
                 order.update({"x_studio_type_de_livraison": "Log'ins",
                               "x_studio_statut_rsilience": "Envoyé à l’entrepôt"})
 
@@ -44,17 +52,11 @@ class SaleOrder(models.Model):
 class SaleOrderImportMapper(Component):
     _inherit = 'prestashop.sale.order.mapper'
 
-    @mapping
-    def studio1(self, record):
-        return {'x_studio_statut_rsilience': "Envoyé à l’entrepôt"}
-
-    @mapping
-    def studio2(self, record):
-        return {'x_studio_type_de_livraison': "Log'ins"}
-
-    @mapping
-    def team(self, record):
-        return {'team_id': 2}
+    _static_values = {
+        'x_studio_statut_rsilience': "Envoyé à l’entrepôt",
+        'x_studio_type_de_livraison': "Log'ins",
+        'team_id': 2,
+    }
 
     """@mapping
     def studio3(self, record):
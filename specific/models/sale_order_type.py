@@ -1,6 +1,6 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import api, fields, models
+from odoo import api, fields, models, tools
 
 
 class SaleOrderTypology(models.Model):
@@ -16,3 +16,27 @@ class SaleOrderTypology(models.Model):
         string="Partner Sequence",
         copy=False,
     )
+    is_web_type = fields.Boolean(
+        string="Odoo Web Shop",
+        help="Orders of this type are shipped by Log'ins and their customers "
+             "are flagged as Odoo web customers.",
+    )
+
+    @api.model
+    @tools.ormcache("self.env.lang", "tuple(self.env.companies.ids)")
+    def _get_default_type_id(self):
+        """Type of the orders without customer."""
+        return self.search([("name", "=", "B2B Odoo")], order="id desc", limit=1).id
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        self.clear_caches()
+        return super(SaleOrderTypology, self).create(vals_list)
+
+    def write(self, vals):
+        self.clear_caches()
+        return super(SaleOrderTypology, self).write(vals)
+
+    def unlink(self):
+        self.clear_caches()
+        return super(SaleOrderTypology, self).unlink()